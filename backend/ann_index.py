@@ -0,0 +1,180 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from template_index import TemplateIndex, _as_matrix, _normalize
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+EMBEDDINGS_SAVE_PATH = os.path.join(BASE_DIR, "template_embeddings.npy")
+ANN_INDEX_SAVE_PATH = os.path.join(BASE_DIR, "template_ann_index.npz")
+
+
+def _spherical_kmeans(vectors, n_lists, n_iter=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(n_lists):
+            members = vectors[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+            else:
+                # Re-seed empty lists so every list stays useful
+                centroids[c] = vectors[rng.integers(len(vectors))]
+        centroids = _normalize(centroids)
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+class IVFTemplateIndex:
+    """Approximate template index (inverted file over k-means cells).
+
+    Exposes the same search/find_duplicates API as TemplateIndex. Each query
+    is only scored against the templates in its `nprobe` closest cells, so
+    `nprobe` trades recall for latency (nprobe == n_lists is an exact scan).
+    """
+
+    def __init__(self, embeddings, centroids, ids, offsets, nprobe=8):
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        # Normalized vectors stored cell by cell so each cell is one contiguous slice
+        self.normalized = np.ascontiguousarray(_normalize(self.embeddings)[self.ids])
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, embeddings, n_lists=None, nprobe=8, seed=0):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(len(embeddings))))
+        n_lists = min(n_lists, len(embeddings))
+        centroids, assign = _spherical_kmeans(_normalize(embeddings), n_lists, seed=seed)
+        ids = np.argsort(assign, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))])
+        return cls(embeddings, centroids, ids, offsets, nprobe=nprobe)
+
+    def save(self, path=ANN_INDEX_SAVE_PATH):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, embeddings=self.embeddings, centroids=self.centroids,
+                 ids=self.ids, offsets=self.offsets, nprobe=self.nprobe)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=ANN_INDEX_SAVE_PATH, nprobe=None):
+        data = np.load(path)
+        return cls(data["embeddings"], data["centroids"], data["ids"], data["offsets"],
+                   nprobe=int(data["nprobe"]) if nprobe is None else nprobe)
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    @property
+    def dim(self):
+        return self.embeddings.shape[1]
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def _candidates(self, query, nprobe, k=1):
+        # The nprobe closest cells, plus further ones while they hold fewer than k
+        # templates (k-means can leave a cell empty)
+        order = np.argsort(-(self.centroids @ query))
+        covered = np.cumsum(self.offsets[order + 1] - self.offsets[order])
+        n_cells = max(nprobe, int(np.searchsorted(covered, min(k, len(self)))) + 1)
+        return np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in order[:n_cells]])
+
+    def search(self, queries, k=1, nprobe=None):
+        """Return (scores, indices) of the approximate top-k templates, best first.
+
+        Cells beyond `nprobe` are probed until there are k candidates, so
+        results are only missing (-inf / -1) when k exceeds the template count.
+        """
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        queries = _normalize(_as_matrix(queries))
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        for q, query in enumerate(queries):
+            rows = self._candidates(query, nprobe, k)
+            sims = self.normalized[rows] @ query
+            top = np.argsort(-sims)[:k]
+            scores[q, :len(top)] = sims[top]
+            indices[q, :len(top)] = self.ids[rows[top]]
+        return scores, indices
+
+    def find_duplicates(self, queries, atol=1e-6, rtol=1e-5):
+        """Index of a template each query is numerically identical to, or -1."""
+        queries = _as_matrix(queries)
+        _, indices = self.search(queries, k=1, nprobe=1)
+        result = np.full(len(queries), -1, dtype=np.int64)
+        for q, idx in enumerate(indices[:, 0]):
+            if idx >= 0 and np.allclose(queries[q], self.embeddings[idx], atol=atol, rtol=rtol):
+                result[q] = idx
+        return result
+
+
+def benchmark(embeddings, ann, n_queries=200, k=5, noise=0.05, seed=0):
+    """Recall@k and per-query latency of `ann` against the exact TemplateIndex.
+
+    Queries are templates perturbed with Gaussian noise, which mimics photos
+    of known card layouts.
+    """
+    rng = np.random.default_rng(seed)
+    exact = TemplateIndex(embeddings)
+    base = exact.embeddings[rng.integers(len(exact), size=n_queries)]
+    scale = noise * np.linalg.norm(base, axis=1, keepdims=True) / np.sqrt(exact.dim)
+    queries = (base + rng.normal(size=base.shape).astype(np.float32) * scale).astype(np.float32)
+
+    start = time.perf_counter()
+    exact_scores, exact_idx = exact.search(queries, k=k)
+    exact_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ann_scores, ann_idx = ann.search(queries, k=k)
+    ann_time = time.perf_counter() - start
+
+    hits = sum(len(set(a) & set(e)) for a, e in zip(ann_idx, exact_idx))
+    return {
+        "templates": len(exact),
+        "k": k,
+        "nprobe": ann.nprobe,
+        "recall_at_k": hits / (n_queries * k),
+        "top1_agreement": float(np.mean(ann_idx[:, 0] == exact_idx[:, 0])),
+        "max_top1_score_diff": float(np.max(np.abs(exact_scores[:, 0] - ann_scores[:, 0]))),
+        "exact_ms_per_query": 1000 * exact_time / n_queries,
+        "ann_ms_per_query": 1000 * ann_time / n_queries,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or benchmark the approximate template index")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_p = sub.add_parser("build", help="Build the ANN index from template embeddings")
+    build_p.add_argument("--embeddings", default=EMBEDDINGS_SAVE_PATH)
+    build_p.add_argument("--out", default=ANN_INDEX_SAVE_PATH)
+    build_p.add_argument("--lists", type=int, default=None, help="Number of k-means cells (default sqrt(N))")
+    build_p.add_argument("--nprobe", type=int, default=8, help="Default cells probed per query")
+
+    bench_p = sub.add_parser("bench", help="Compare ANN recall/latency with the exact scorer")
+    bench_p.add_argument("--index", default=ANN_INDEX_SAVE_PATH)
+    bench_p.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    bench_p.add_argument("--queries", type=int, default=200)
+    bench_p.add_argument("-k", type=int, default=5)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        index = IVFTemplateIndex.build(np.load(args.embeddings), n_lists=args.lists, nprobe=args.nprobe)
+        index.save(args.out)
+        print(f"✅ Built ANN index with {len(index)} templates in {index.n_lists} cells -> {args.out}")
+    else:
+        index = IVFTemplateIndex.load(args.index)
+        for nprobe in args.nprobe:
+            index.nprobe = min(nprobe, index.n_lists)
+            print(benchmark(index.embeddings, index, n_queries=args.queries, k=args.k))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+# Dynamic micro-batching for the ResNet forward passes
+ENABLE_BATCHING = os.environ.get("ENABLE_BATCHING", "1") == "1"
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "16"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "5"))
+
+
+class BatchScheduler:
+    """Collects concurrent single-image requests into one batched forward pass.
+
+    Callers submit (1, C, H, W) tensors from any thread and block on their own
+    slice of the output. A background thread waits at most `max_wait_ms` after
+    the first pending tensor for up to `max_batch_size` tensors, then runs
+    `forward` once on the concatenated batch.
+    """
+
+    def __init__(self, forward, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, name="batcher"):
+        self.forward = forward
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, tensor) -> Future:
+        future = Future()
+        self._queue.put((tensor, future))
+        return future
+
+    def __call__(self, tensor):
+        return self.submit(tensor).result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return [(t, f) for t, f in batch if f.set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                continue
+            try:
+                with torch.no_grad():
+                    outputs = self.forward(torch.cat([t for t, _ in batch]))
+                offset = 0
+                for tensor, future in batch:
+                    size = tensor.shape[0]
+                    future.set_result(outputs[offset:offset + size])
+                    offset += size
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+
+def batched(model, device, name="batcher"):
+    """Wrap `model` in a BatchScheduler, or return it unchanged if batching is off."""
+    if not ENABLE_BATCHING:
+        return model
+    return BatchScheduler(lambda batch: model(batch.to(device)), name=name)
@@ -0,0 +1,256 @@
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from college_matcher import COLLEGE_REGISTRY_PATH, CollegeMatcher
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+FIRST_NAMES = ["Ravi", "Sai", "Priya", "Mohammed", "Lakshmi", "Anjali", "Karthik", "Sneha"]
+LAST_NAMES = ["Kumar", "Reddy", "Sharma", "Arif", "Devi", "Rao", "Naidu", "Varma"]
+YEARS = ["First", "Second", "Third", "Fourth"]
+COURSES = ["B.Tech", "M.Tech", "MBA", "BSc", "MSc"]
+BRANCHES = ["CSE", "ECE", "EEE", "MECH", "CIVIL", "IT", "AI ML"]
+
+
+# --- Synthetic ID cards ---
+
+def _font(size):
+    for name in ("DejaVuSans-Bold.ttf", "arial.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+def synthetic_card(rng, colleges, width=1012, height=638, photo_scale=1.0, rotation=0):
+    """Card-like image: college header, student fields and a face placeholder on a plain background.
+
+    `rotation` turns the card by that many degrees counter-clockwise before it
+    is photographed, so 90/270 give portrait cards that need Tesseract OSD.
+    Returns (JPEG bytes, user_id).
+    """
+    card = Image.new("RGB", (width, height), (245, 245, 240))
+    draw = ImageDraw.Draw(card)
+    draw.rectangle([0, 0, width, int(height * 0.2)], fill=(20, 60, 140))
+    draw.text((30, int(height * 0.06)), rng.choice(colleges), fill="white", font=_font(34))
+
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    roll_no = f"{rng.randint(16, 24)}{rng.randint(100, 999)}A{rng.randint(1000, 9999)}"
+    lines = [f"Name: {name}", f"Roll No: {roll_no}", f"{rng.choice(YEARS)} Year",
+             f"{rng.choice(COURSES)} {rng.choice(BRANCHES)}"]
+    font = _font(30)
+    for i, line in enumerate(lines):
+        draw.text((330, int(height * 0.3) + i * 60), line, fill="black", font=font)
+
+    # Face placeholder: head and shoulders in the photo box
+    px0, py0 = 40, int(height * 0.28)
+    px1, py1 = px0 + int(240 * photo_scale), py0 + int(300 * photo_scale)
+    draw.rectangle([px0, py0, px1, py1], fill=(200, 210, 225), outline="black")
+    cx = (px0 + px1) // 2
+    draw.ellipse([cx - 60, py0 + 40, cx + 60, py0 + 190], fill=(224, 186, 150))
+    draw.ellipse([cx - 35, py0 + 95, cx - 15, py0 + 110], fill="black")
+    draw.ellipse([cx + 15, py0 + 95, cx + 35, py0 + 110], fill="black")
+    draw.arc([cx - 30, py0 + 130, cx + 30, py0 + 165], 0, 180, fill="black", width=3)
+    draw.rectangle([cx - 100, py0 + 200, cx + 100, py1], fill=(60, 60, 90))
+
+    # Place the card on a larger "photo" background, as a phone picture would
+    if rotation:
+        card = card.rotate(rotation, expand=True)
+    photo = Image.new("RGB", (int(card.width * 1.4), int(card.height * 1.6)), (90, 80, 70))
+    photo.paste(card, ((photo.width - card.width) // 2, (photo.height - card.height) // 2))
+    buffer = io.BytesIO()
+    photo.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue(), roll_no.lower()
+
+
+def generate_cards(count, seed=0, rotated_fraction=0.0):
+    """`rotated_fraction` of the cards are photographed sideways (portrait), the rest upright."""
+    rng = random.Random(seed)
+    colleges = CollegeMatcher.from_file(COLLEGE_REGISTRY_PATH).names
+    return [synthetic_card(rng, colleges, rotation=rng.choice((90, 270)) if rng.random() < rotated_fraction else 0)
+            for _ in range(count)]
+
+
+def summarize(latencies):
+    values = np.asarray(latencies) * 1000
+    return {
+        "count": int(len(values)),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+    }
+
+
+# --- Per-stage latency (in-process) ---
+
+def bench_stages(cards):
+    """(per-stage latency summaries, how many cards each orientation source handled)."""
+    import model_registry
+    from face_detector import face_present
+    from image_classifier import predict_from_context
+    from image_context import ImageContext
+    from ocr_validator import extract_text_for_context, preprocess_text, validate_college_name
+    from template_validator import match_template
+
+    model_registry.warm_up()
+    timings = {}
+    sources = {}
+
+    def timed(stage, func):
+        start = time.perf_counter()
+        value = func()
+        timings.setdefault(stage, []).append(time.perf_counter() - start)
+        return value
+
+    def decode(image_bytes):
+        ctx = ImageContext(image_bytes)
+        ctx.upright
+        return ctx
+
+    for image_bytes, _ in cards:
+        # Each view is memoized, so every stage measures only its own work
+        ctx = timed("decode", lambda: decode(image_bytes))
+        timed("card_crop", lambda: ctx.card)
+        orientation = timed("orientation", lambda: ctx.orientation)
+        sources[orientation.source] = sources.get(orientation.source, 0) + 1
+        timed("classifier", lambda: predict_from_context(ctx))
+        timed("template_match", lambda: match_template(ctx))
+        text, _ = timed("ocr", lambda: extract_text_for_context(ctx))
+        timed("face_detection", lambda: face_present(ctx))
+        timed("college_match", lambda: validate_college_name(preprocess_text(text)))
+
+    return {stage: summarize(values) for stage, values in timings.items()}, sources
+
+
+# --- End-to-end against a local uvicorn ---
+
+def start_server(port, workers=1):
+    if workers > 1:
+        # Preforking server with the models shared between workers (serve.py)
+        command = [sys.executable, "serve.py", "--port", str(port), "--workers", str(workers),
+                   "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"]
+    server = subprocess.Popen(command, cwd=BACKEND_DIR)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 300
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=2) as response:
+                if response.status == 200:
+                    return server, url
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        if server.poll() is not None:
+            raise RuntimeError("uvicorn exited before becoming ready")
+        time.sleep(1)
+    server.terminate()
+    raise RuntimeError("uvicorn did not become ready in time")
+
+
+def post_validate(url, image_bytes, user_id):
+    body = json.dumps({"user_id": user_id, "image_base64": base64.b64encode(image_bytes).decode()}).encode()
+    request = urllib.request.Request(f"{url}/validate-id", data=body, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=120) as response:
+        body = response.read()
+    return time.perf_counter() - start, json.loads(body)
+
+
+def bench_end_to_end(url, cards, concurrency):
+    """Latency summary plus the outcomes behind it.
+
+    `labels` and `skipped_stages` show which path the requests took: cards
+    rejected by the early-exit cascade skip OCR and are much faster.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        responses = list(pool.map(lambda card: post_validate(url, *card), cards))
+    elapsed = time.perf_counter() - start
+    labels, skipped = {}, {}
+    for _, body in responses:
+        labels[body.get("label")] = labels.get(body.get("label"), 0) + 1
+        for stage in body.get("skipped_stages", []):
+            skipped[stage] = skipped.get(stage, 0) + 1
+    return {**summarize([latency for latency, _ in responses]), "concurrency": concurrency,
+            "requests_per_sec": len(cards) / elapsed, "labels": labels, "skipped_stages": skipped}
+
+
+def main():
+    # Run from backend/ (model paths are relative to it), e.g.
+    #   python benchmark.py --images 100 --concurrency 1 4 8 --out bench.json
+    parser = argparse.ArgumentParser(description="Benchmark the ID validation pipeline")
+    parser.add_argument("--images", type=int, default=50, help="Synthetic cards per run")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--url", help="Benchmark an already running server instead of starting uvicorn")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="Server worker processes (forked via serve.py)")
+    parser.add_argument("--skip-stages", action="store_true", help="Only run the end-to-end benchmark")
+    parser.add_argument("--skip-e2e", action="store_true", help="Only run the per-stage benchmark")
+    parser.add_argument("--out", help="Write JSON results to this file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rotated-fraction", type=float, default=0.25,
+                        help="Share of portrait (sideways) cards, which need Tesseract OSD")
+    args = parser.parse_args()
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "images": args.images,
+        "workers": args.workers,
+        "rotated_fraction": args.rotated_fraction,
+        "env": {k: v for k, v in os.environ.items() if k in (
+            "INFERENCE_BACKEND", "ENABLE_BATCHING", "EARLY_EXIT", "OCR_BACKEND", "RESULT_CACHE", "CROP_CARD")},
+    }
+
+    # Effective values even when unset (the started server inherits them; not so with --url):
+    # whether upright cards run OSD at all, and whether rejected cards skip OCR
+    results["env"]["SKIP_OSD_WHEN_UPRIGHT"] = os.environ.get("SKIP_OSD_WHEN_UPRIGHT", "1")
+    results["env"]["EARLY_EXIT"] = os.environ.get("EARLY_EXIT", "1")
+
+    if not args.skip_stages:
+        cards = generate_cards(args.images, args.seed, args.rotated_fraction)
+        results["stages"], results["orientation_sources"] = bench_stages(cards)
+
+    if not args.skip_e2e:
+        server = None
+        url = args.url
+        if url is None:
+            server, url = start_server(args.port, args.workers)
+        try:
+            results["end_to_end"] = []
+            for i, concurrency in enumerate(args.concurrency):
+                # Fresh cards per run so the result cache never hits
+                cards = generate_cards(args.images, args.seed + 1 + i, args.rotated_fraction)
+                results["end_to_end"].append(bench_end_to_end(url, cards, concurrency))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
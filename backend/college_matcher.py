@@ -0,0 +1,155 @@
+import argparse
+import json
+import logging
+import os
+import random
+import re
+
+import numpy as np
+from rapidfuzz import fuzz, process, utils
+
+logger = logging.getLogger(__name__)
+
+COLLEGE_REGISTRY_PATH = os.environ.get(
+    "COLLEGE_REGISTRY_PATH", os.path.join(os.path.dirname(__file__), "colleges.json")
+)
+
+def normalize(text):
+    return utils.default_process(text)
+
+
+def name_variants(name, aliases=()):
+    """The full name plus "Short (Long)" halves and explicit aliases, e.g. CBIT / GRIET."""
+    variants = [name]
+    parts = re.match(r"^(.*?)\s*\((.*)\)\s*$", name)
+    if parts:
+        variants.extend(p for p in parts.groups() if p.strip())
+    variants.extend(aliases)
+    return variants
+
+
+class CollegeMatcher:
+    """Precompiled fuzzy matcher over the college registry.
+
+    Built once: every name variant is normalized up front. A query is scored
+    (token_set_ratio, plus the substring bonus) against every variant in one
+    batched rapidfuzz call. The registry is small, so the full scan is cheap,
+    and it is the only way to be sure of the best match: OCR text shares
+    tokens like "hyderabad" with many names, and a typo in a one-word name
+    leaves only those shared tokens to go on.
+    """
+
+    def __init__(self, colleges):
+        self.colleges = []  # registry entries as loaded
+        self.names = []
+        self.choices = []   # normalized variant strings
+        self.owner = []     # choice index -> college index
+        for college in colleges:
+            if isinstance(college, str):
+                college = {"name": college}
+            college_idx = len(self.names)
+            self.colleges.append(college)
+            self.names.append(college["name"])
+            for variant in name_variants(college["name"], college.get("aliases", [])):
+                choice = normalize(variant)
+                if not choice or choice in self.choices:
+                    continue
+                self.choices.append(choice)
+                self.owner.append(college_idx)
+        self.owner = np.array(self.owner)
+
+    @classmethod
+    def from_file(cls, path=COLLEGE_REGISTRY_PATH):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def best_match(self, text):
+        """(college name, score) of the best registry entry for `text`."""
+        text = normalize(text)
+        if not text:
+            return None, 0.0
+        # One query row: workers=-1 would spin up a thread per core inside request threads
+        scores = process.cdist([text], self.choices, scorer=fuzz.token_set_ratio, dtype=np.float32)[0]
+        # Slight bonus if query is a substring of the college name
+        scores += np.array([10 if text in c else 0 for c in self.choices], dtype=np.float32)
+        best = int(np.argmax(scores))  # first maximum keeps registry order on ties
+        return self.names[self.owner[best]], float(scores[best])
+
+    def match(self, text, threshold=75):
+        name, score = self.best_match(text)
+        logger.debug("Best match: %s (score: %s)", name, score)
+        return (True, name) if score >= threshold else (False, None)
+
+
+# --- Consistency check against a plain per-name loop ---
+
+# OCR-like card text: every card prints "hyderabad", so a misread one-word
+# college name must not resolve to whichever "... Hyderabad" entry scores 75
+OCR_TEXTS = [
+    "vasavl college of engineering ibrahimbagh hyderabad name ravi kumar roll no 1602 21 733 045",
+    "anurag unversity venkatapur ghatkesar hyderabad student id card",
+    "osmanla university hyderabad telangana second year",
+    "mahlndra university bahadurpally hyderabad btech cse",
+    "iit hyderabad kandi sangareddy",
+    "cbit gandipet hyderabad roll no 1601 22 737 001",
+]
+
+
+def _reference_best(matcher, text):
+    # One token_set_ratio call per variant, keeping the first maximum
+    text = normalize(text)
+    if not text:
+        return None, 0.0
+    best_idx, best_score = 0, -1.0
+    for idx, choice in enumerate(matcher.choices):
+        score = fuzz.token_set_ratio(text, choice) + (10 if text in choice else 0)
+        if score > best_score:
+            best_idx, best_score = idx, score
+    return matcher.names[matcher.owner[best_idx]], float(best_score)
+
+
+def check_corpus(matcher, corpus):
+    """Texts whose best match differs from the per-name loop, with both answers."""
+    mismatches = []
+    for text in corpus:
+        got, expected = matcher.best_match(text), _reference_best(matcher, text)
+        if got[0] != expected[0] or abs(got[1] - expected[1]) > 1e-3:
+            mismatches.append((text, got, expected))
+    return mismatches
+
+
+def synthetic_corpus(names, size, seed=0):
+    """Registry names with a dropped or swapped letter, embedded in card-like noise."""
+    rng = random.Random(seed)
+    corpus = list(OCR_TEXTS)
+    for _ in range(size):
+        name = list(rng.choice(names).lower())
+        pos = rng.randrange(len(name))
+        if rng.random() < 0.5:
+            del name[pos]
+        else:
+            name[pos] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+        corpus.append(f"{''.join(name)} hyderabad roll no {rng.randint(10**9, 10**10)}")
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the batched college matcher against a per-name loop")
+    parser.add_argument("--corpus", help="Text file with one OCR output per line (default: synthetic)")
+    parser.add_argument("--size", type=int, default=2000, help="Synthetic corpus size")
+    args = parser.parse_args()
+    matcher = CollegeMatcher.from_file()
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            corpus = [line.strip() for line in f if line.strip()] + OCR_TEXTS
+    else:
+        corpus = synthetic_corpus(matcher.names, args.size)
+    mismatches = check_corpus(matcher, corpus)
+    for text, got, expected in mismatches[:20]:
+        print(f"MISMATCH {text!r}: {got} vs {expected}")
+    print(f"identical best match on {len(corpus) - len(mismatches)}/{len(corpus)} texts")
+    raise SystemExit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
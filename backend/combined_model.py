@@ -0,0 +1,91 @@
+import os
+
+import torch
+import torch.nn as nn
+from torchvision.models import resnet50
+
+import model_registry
+from batching import batched
+
+# Optional single-backbone mode: one ResNet-50 forward pass yields both the
+# fake/genuine/non-id logits and the 2048-d template embedding.
+USE_COMBINED_MODEL = os.environ.get("COMBINED_MODEL", "0") == "1"
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+TEMPLATE_MODEL_PATH = os.path.join(BASE_DIR, "resnet_template.pth")
+COMBINED_MODEL_PATH = os.path.join(os.path.dirname(__file__), "combined_model.pth")
+CLASS_NAMES = ['fake', 'genuine', 'non-id']
+DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def backbone_features(model, inputs):
+    """Pooled 2048-d ResNet-50 features (the template embedding)."""
+    x = model.conv1(inputs)
+    x = model.bn1(x)
+    x = model.relu(x)
+    x = model.maxpool(x)
+    x = model.layer1(x)
+    x = model.layer2(x)
+    x = model.layer3(x)
+    x = model.layer4(x)
+    x = model.avgpool(x)
+    return torch.flatten(x, 1)
+
+
+class CombinedIDModel(nn.Module):
+    """Template ResNet-50 backbone with a 3-class ID head on its embedding.
+
+    The backbone is the one trained by template_train.py and stays frozen, so
+    embeddings remain comparable with template_embeddings.npy; train.py only
+    trains the head.
+    """
+
+    def __init__(self, num_classes=len(CLASS_NAMES)):
+        super().__init__()
+        self.backbone = resnet50(weights=None)
+        self.backbone.fc = nn.Identity()
+        self.head = nn.Linear(2048, num_classes)
+
+    @classmethod
+    def from_template_backbone(cls, path=TEMPLATE_MODEL_PATH, num_classes=len(CLASS_NAMES)):
+        model = cls(num_classes)
+        state_dict = torch.load(path, map_location="cpu", weights_only=True)
+        model.backbone.load_state_dict(state_dict, strict=False)
+        for param in model.backbone.parameters():
+            param.requires_grad = False
+        return model
+
+    def forward(self, x):
+        embedding = backbone_features(self.backbone, x)
+        return self.head(embedding), embedding
+
+    def packed(self, x):
+        # Single tensor [logits | embedding] so outputs can be sliced per request
+        logits, embedding = self(x)
+        return torch.cat([logits, embedding], dim=1)
+
+
+def load_model(path=COMBINED_MODEL_PATH):
+    model = CombinedIDModel()
+    model.load_state_dict(torch.load(path, map_location=DEVICE, weights_only=True))
+    model.to(DEVICE)
+    model.eval()
+    return model
+
+
+if USE_COMBINED_MODEL:
+    model_registry.register("combined_model", load_model, files=[COMBINED_MODEL_PATH])
+    model_registry.register("combined_runner",
+                            lambda: batched(model_registry.get("combined_model").packed, DEVICE,
+                                            name="combined-batcher"),
+                            fork_safe=False)
+
+
+def combined_forward(image):
+    """(logits, embedding) for a request's ImageContext, computed once per request."""
+    def run():
+        tensor = image.oriented_tensor.to(DEVICE)
+        with image.timer("combined_forward"), torch.no_grad():
+            packed = model_registry.get("combined_runner")(tensor)
+        num_classes = len(CLASS_NAMES)
+        return packed[:, :num_classes].cpu(), packed[:, num_classes:].cpu()
+    return image.memo("combined_outputs", run)
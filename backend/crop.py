@@ -1,47 +1,88 @@
+import os
+
 import cv2
 import numpy as np
 
-def crop_id_card(input_path, output_path="cropped_id.jpg"):
-    # Read the image
-    image = cv2.imread(input_path)
-    if image is None:
-        print("❌ Could not read the image.")
-        return
+# Card detection runs on a copy resized to this width; the warp uses full resolution
+DETECT_WIDTH = 800
+# Ignore quadrilaterals smaller than this share of the photo (e.g. the face photo box)
+MIN_CARD_AREA_RATIO = float(os.environ.get("MIN_CARD_AREA_RATIO", "0.2"))
+# Longest side of the warped card handed to the downstream stages
+CARD_MAX_SIDE = int(os.environ.get("CARD_MAX_SIDE", "1600"))
 
-    # Resize for better handling
-    ratio = 800.0 / image.shape[1]
-    dim = (800, int(image.shape[0] * ratio))
-    resized = cv2.resize(image, dim)
 
-    # Convert to grayscale
-    gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
+def order_corners(pts):
+    """Corners as top-left, top-right, bottom-right, bottom-left."""
+    pts = pts.reshape(4, 2).astype(np.float32)
+    s = pts.sum(axis=1)
+    d = np.diff(pts, axis=1).ravel()
+    return np.array([pts[np.argmin(s)], pts[np.argmin(d)], pts[np.argmax(s)], pts[np.argmax(d)]],
+                    dtype=np.float32)
 
-    # Blur to remove noise
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
 
-    # Edge detection
-    edged = cv2.Canny(blurred, 50, 200)
+def find_card_quad(image):
+    """Corners (full-resolution coordinates) of the largest 4-sided contour, or None."""
+    ratio = DETECT_WIDTH / image.shape[1]
+    dim = (DETECT_WIDTH, int(image.shape[0] * ratio))
+    resized = cv2.resize(image, dim, interpolation=cv2.INTER_AREA)
 
-    # Find contours
-    contours, _ = cv2.findContours(edged.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    # Grayscale, blur to remove noise, edge detection
+    gray = resized if resized.ndim == 2 else cv2.cvtColor(resized, cv2.COLOR_RGB2GRAY)
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    edged = cv2.Canny(blurred, 50, 200)
 
-    # Sort contours by area (largest first)
+    # Contours sorted by area (largest first)
+    contours, _ = cv2.findContours(edged, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     contours = sorted(contours, key=cv2.contourArea, reverse=True)
 
-    # Loop through contours to find a 4-cornered shape (likely ID card)
+    min_area = MIN_CARD_AREA_RATIO * dim[0] * dim[1]
     for c in contours:
+        if cv2.contourArea(c) < min_area:
+            break
         peri = cv2.arcLength(c, True)
         approx = cv2.approxPolyDP(c, 0.02 * peri, True)
-
         if len(approx) == 4:
-            x, y, w, h = cv2.boundingRect(approx)
-            cropped = resized[y:y+h, x:x+w]
-            cv2.imwrite(output_path, cropped)
-            print(f"✅ Cropped ID card saved as '{output_path}'")
-            return
+            return order_corners(approx) / ratio
+    return None
+
+
+def warp_card(image, corners, max_side=CARD_MAX_SIDE):
+    """Perspective-correct the quadrilateral into a flat card no larger than `max_side`."""
+    tl, tr, br, bl = corners
+    width = max(np.linalg.norm(br - bl), np.linalg.norm(tr - tl))
+    height = max(np.linalg.norm(tr - br), np.linalg.norm(tl - bl))
+    scale = min(1.0, max_side / max(width, height))
+    width, height = max(1, int(width * scale)), max(1, int(height * scale))
+    target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(corners, target)
+    return cv2.warpPerspective(image, matrix, (width, height))
+
+
+def crop_card(image):
+    """Card-only array cropped from an RGB (or grayscale) array, or None if no card is found."""
+    corners = find_card_quad(image)
+    if corners is None:
+        return None
+    return warp_card(image, corners)
+
+
+def crop_id_card(input_path, output_path="cropped_id.jpg"):
+    # Read the image
+    image = cv2.imread(input_path)
+    if image is None:
+        print("❌ Could not read the image.")
+        return
+
+    cropped = crop_card(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    if cropped is None:
+        print("❌ Could not find a rectangular ID card in the image.")
+        return
+
+    cv2.imwrite(output_path, cv2.cvtColor(cropped, cv2.COLOR_RGB2BGR))
+    print(f"✅ Cropped ID card saved as '{output_path}'")
 
-    print("❌ Could not find a rectangular ID card in the image.")
 
 # === Usage ===
-input_image_path = "20250528_130415.jpg"  # Replace with your image path
-crop_id_card(input_image_path)
+if __name__ == "__main__":
+    input_image_path = "20250528_130415.jpg"  # Replace with your image path
+    crop_id_card(input_image_path)
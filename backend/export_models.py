@@ -0,0 +1,127 @@
+import argparse
+import os
+import random
+import sys
+
+import numpy as np
+import torch
+import torch.nn as nn
+from PIL import Image
+from torchvision.models import quantization as qmodels
+
+import image_classifier
+import template_validator
+from image_context import tensor_transform
+from image_files import image_files
+from inference_backends import exported_path, export_onnx, export_quantized, load_exported
+from template_index import TemplateIndex
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DATASET_DIR = os.path.join(BASE_DIR, "dataset")
+TEMPLATE_DIR = os.path.join(BASE_DIR, "templates")
+
+
+def split_files(root, calibration, held_out, seed=0):
+    """Disjoint calibration and held-out file lists."""
+    files = image_files(root, recursive=True)  # dataset/ has a folder per class
+    random.Random(seed).shuffle(files)
+    return files[:calibration], files[calibration:calibration + held_out]
+
+
+def batches(files, batch_size=16):
+    for i in range(0, len(files), batch_size):
+        yield torch.stack([tensor_transform(Image.open(f).convert('RGB')) for f in files[i:i + batch_size]])
+
+
+def quantizable_classifier(path):
+    model = qmodels.resnet18(weights=None, quantize=False)
+    model.fc = nn.Linear(model.fc.in_features, 3)
+    model.load_state_dict(torch.load(path, map_location="cpu"))
+    return model
+
+
+def quantizable_template_model(path):
+    model = qmodels.resnet50(weights=None, quantize=False)
+    model.fc = nn.Identity()
+    model.load_state_dict(torch.load(path, map_location="cpu", weights_only=True), strict=False)
+    return model
+
+
+def export(args):
+    cls_calib, _ = split_files(args.classifier_data, args.calibration, 0)
+    tpl_calib, _ = split_files(args.template_data, args.calibration, 0)
+    cls_path = image_classifier.CLASSIFIER_MODEL_PATH
+    tpl_path = template_validator.MODEL_SAVE_PATH
+
+    for backend in args.backends:
+        if backend == "quantized":
+            export_quantized(quantizable_classifier(cls_path), batches(cls_calib), exported_path(cls_path, backend))
+            export_quantized(quantizable_template_model(tpl_path), batches(tpl_calib), exported_path(tpl_path, backend))
+        elif backend == "onnx":
+            export_onnx(image_classifier.load_model(cls_path, backend="torch"), exported_path(cls_path, backend))
+            export_onnx(template_validator.load_model(backend="torch"), exported_path(tpl_path, backend))
+        print(f"✅ Exported {backend} models")
+
+
+def run(model, files):
+    outputs = []
+    with torch.no_grad():
+        for batch in batches(files):
+            outputs.append(model(batch.to(image_classifier.device)).cpu())
+    return torch.cat(outputs)
+
+
+def parity(args):
+    """Compare an exported backend against the float32 models on held-out images."""
+    _, cls_files = split_files(args.classifier_data, args.calibration, args.held_out)
+    _, tpl_files = split_files(args.template_data, args.calibration, args.held_out)
+    ok = True
+
+    cls_path = image_classifier.CLASSIFIER_MODEL_PATH
+    float_probs = torch.softmax(run(image_classifier.load_model(cls_path, backend="torch"), cls_files), dim=1)
+    backend_probs = torch.softmax(run(load_exported(cls_path, args.backend), cls_files), dim=1)
+    prob_diff = float((float_probs - backend_probs).abs().max())
+    agreement = float((float_probs.argmax(1) == backend_probs.argmax(1)).float().mean())
+    print(f"classifier: max |Δp| = {prob_diff:.4f}, top-1 agreement = {agreement:.2%} on {len(cls_files)} images")
+    ok &= prob_diff <= args.prob_tol
+
+    index = TemplateIndex.from_file(template_validator.EMBEDDINGS_SAVE_PATH)
+    float_emb = run(template_validator.load_model(backend="torch"), tpl_files).numpy()
+    backend_emb = run(load_exported(template_validator.MODEL_SAVE_PATH, args.backend), tpl_files).numpy()
+    float_scores, float_idx = index.search(float_emb)
+    backend_scores, backend_idx = index.search(backend_emb)
+    sim_diff = float(np.abs(float_scores - backend_scores).max())
+    match = float(np.mean(float_idx[:, 0] == backend_idx[:, 0]))
+    print(f"template: max |Δsimilarity| = {sim_diff:.4f}, best-template agreement = {match:.2%} "
+          f"on {len(tpl_files)} images")
+    ok &= sim_diff <= args.sim_tol
+
+    print("✅ Within tolerance" if ok else "❌ Outside tolerance")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export INT8/ONNX inference models and check their accuracy")
+    parser.add_argument("--classifier-data", default=DATASET_DIR)
+    parser.add_argument("--template-data", default=TEMPLATE_DIR)
+    parser.add_argument("--calibration", type=int, default=64, help="Images used for calibration")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_p = sub.add_parser("export")
+    export_p.add_argument("--backends", nargs="+", default=["quantized", "onnx"], choices=["quantized", "onnx"])
+
+    parity_p = sub.add_parser("parity")
+    parity_p.add_argument("--backend", required=True, choices=["quantized", "onnx"])
+    parity_p.add_argument("--held-out", type=int, default=200, help="Held-out images compared")
+    parity_p.add_argument("--prob-tol", type=float, default=0.05)
+    parity_p.add_argument("--sim-tol", type=float, default=0.02)
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export(args)
+    elif not parity(args):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from roi_ocr import layout_for, region_box
+
+# Detection runs on a grayscale copy whose longest side is at most this
+FACE_MAX_SIDE = int(os.environ.get("FACE_MAX_SIDE", "640"))
+FACE_MIN_SIZE = 30  # pixels, at full resolution
+# Optional OpenCV DNN face detector (res10 SSD Caffe model), used instead of Haar when present
+FACE_DNN_PROTO = os.environ.get("FACE_DNN_PROTO", os.path.join(os.path.dirname(__file__), "deploy.prototxt"))
+FACE_DNN_MODEL = os.environ.get(
+    "FACE_DNN_MODEL", os.path.join(os.path.dirname(__file__), "res10_300x300_ssd_iter_140000.caffemodel")
+)
+FACE_DNN_CONFIDENCE = float(os.environ.get("FACE_DNN_CONFIDENCE", "0.5"))
+
+# Load face detector
+face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+
+
+USE_FACE_DNN = os.path.exists(FACE_DNN_PROTO) and os.path.exists(FACE_DNN_MODEL)
+
+# setInput()/forward() are stateful, so each validator thread gets its own Net
+_local = threading.local()
+
+
+def _face_net():
+    net = getattr(_local, "net", None)
+    if net is None:
+        net = cv2.dnn.readNetFromCaffe(FACE_DNN_PROTO, FACE_DNN_MODEL)
+        net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        _local.net = net
+    return net
+
+
+def _downscale(gray, max_side=FACE_MAX_SIDE):
+    scale = min(1.0, max_side / max(gray.shape[:2]))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (int(gray.shape[1] * scale), int(gray.shape[0] * scale)),
+                          interpolation=cv2.INTER_AREA)
+    return gray, scale
+
+
+def _detect_haar(image):
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    small, scale = _downscale(gray)
+    min_side = max(12, int(FACE_MIN_SIZE * scale))
+    faces = face_cascade.detectMultiScale(small, scaleFactor=1.1, minNeighbors=5, minSize=(min_side, min_side))
+    return [tuple(int(v / scale) for v in face) for face in faces]
+
+
+def _detect_dnn(image):
+    # The res10 SSD expects a BGR colour image
+    h, w = image.shape[:2]
+    bgr = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR if image.ndim == 2 else cv2.COLOR_RGB2BGR)
+    blob = cv2.dnn.blobFromImage(bgr, 1.0, (300, 300), (104.0, 177.0, 123.0))
+    net = _face_net()
+    net.setInput(blob)
+    detections = net.forward()[0, 0]
+    faces = []
+    for det in detections[detections[:, 2] >= FACE_DNN_CONFIDENCE]:
+        x0, y0, x1, y1 = (det[3:7] * np.array([w, h, w, h])).astype(int)
+        faces.append((x0, y0, x1 - x0, y1 - y0))
+    return faces
+
+
+def detect_faces(image):
+    """Face boxes (x, y, w, h) in the coordinates of `image` (RGB or grayscale array)."""
+    return _detect_dnn(image) if USE_FACE_DNN else _detect_haar(image)
+
+
+def _search_regions(image, pixels):
+    # The template's expected photo box first (if the template is already matched), then the whole card
+    layout = layout_for(image, compute_match=False)
+    photo = (layout or {}).get("regions", {}).get("photo")
+    if photo:
+        yield region_box(photo, pixels.shape[1], pixels.shape[0])
+    yield 0, 0, pixels.shape[1], pixels.shape[0]
+
+
+def find_face(image):
+    """First face box (x, y, w, h) on the request's oriented card, or None (computed once per request)."""
+    return image.memo("face", lambda: _find_face(image))
+
+
+def _find_face(image):
+    # Colour card for the DNN, the cached grayscale view for Haar
+    pixels = np.asarray(image.oriented) if USE_FACE_DNN else image.gray
+    with image.timer("face_detection"):
+        for x0, y0, x1, y1 in _search_regions(image, pixels):
+            faces = detect_faces(pixels[y0:y1, x0:x1])
+            if faces:
+                x, y, w, h = faces[0]
+                return x + x0, y + y0, w, h
+    return None
+
+
+def face_present(image):
+    return find_face(image) is not None
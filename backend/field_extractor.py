@@ -0,0 +1,155 @@
+import argparse
+import random
+import re
+import time
+
+# Default ID-card field patterns. Each has exactly one named group (the field
+# name) holding the value and no other capturing groups.
+DEFAULT_FIELDS = [
+    ("name_extracted",
+     r"name\s*[:\-]?\s*(?P<name_extracted>[A-Za-z]+(?:\s+[A-Za-z]+){1,4})"
+     r"(?=\s+(?:roll\s*no|age|dob|gender|address|phone|email|$))"),
+    ("roll_number", r"roll\s*no\.?\s*[:\-]?\s*(?P<roll_number>[\w\d\-]+)"),
+    ("year", r"(?P<year>(?:first|second|third|fourth)\s+year)"),
+    ("course", r"\b(?P<course>btech|b\.tech|mtech|m\.tech|mba|bsc|msc)\b"),
+    ("branch", r"\b(?P<branch>cse|ece|eee|mech|civil|it|ai\s*ml|ds|cs|ce|eie|aids)\b"),
+]
+
+# Post-processing applied to extracted values
+FIELD_TRANSFORMS = {
+    "name_extracted": str.strip,
+    "branch": str.upper,
+}
+
+
+class FieldSchema:
+    """A set of field patterns, each compiled once.
+
+    `extract` searches the text once per field and keeps each field's first
+    match. Fields are searched independently, so a field whose text overlaps
+    another field's match (e.g. "roll no first year") is still found.
+    """
+
+    def __init__(self, fields=DEFAULT_FIELDS, transforms=FIELD_TRANSFORMS):
+        self.fields = list(fields)
+        self.names = [name for name, _ in self.fields]
+        self.transforms = dict(transforms)
+        self.patterns = [(name, re.compile(pattern, re.IGNORECASE)) for name, pattern in self.fields]
+
+    def extend(self, fields, transforms=None):
+        """New schema with `fields` (name -> pattern) added or replacing same-named fields."""
+        overrides = dict(fields)
+        merged = [(name, overrides.pop(name, pattern)) for name, pattern in self.fields]
+        merged.extend(overrides.items())
+        return FieldSchema(merged, {**self.transforms, **(transforms or {})})
+
+    def extract(self, text):
+        found = {}
+        for name, pattern in self.patterns:
+            match = pattern.search(text)
+            value = match.group(name) if match else None
+            transform = self.transforms.get(name)
+            found[name] = transform(value) if transform and value is not None else value
+        return found
+
+
+default_schema = FieldSchema()
+_college_schemas = {}
+
+
+def register_college_schema(college, fields, transforms=None):
+    """Per-college fields (name -> pattern) layered on top of the default schema."""
+    _college_schemas[college] = default_schema.extend(fields, transforms)
+
+
+def schema_for(college=None):
+    return _college_schemas.get(college, default_schema)
+
+
+def extract_fields(text, college=None):
+    return schema_for(college).extract(text)
+
+
+# --- Consistency check against the previous per-field re.search functions ---
+
+def _legacy_extract(text):
+    name_match = re.search(
+        r"name\s*[:\-]?\s*([A-Za-z]+(?:\s+[A-Za-z]+){1,4})(?=\s+(roll\s*no|age|dob|gender|address|phone|email|$))",
+        text,
+        re.IGNORECASE
+    )
+    roll_match = re.search(r"roll\s*no\.?\s*[:\-]?\s*([\w\d\-]+)", text, re.IGNORECASE)
+    year_match = re.search(r"(first|second|third|fourth)\s+year", text, re.IGNORECASE)
+    course_match = re.search(r"\b(btech|b\.tech|mtech|m\.tech|mba|bsc|msc)\b", text, re.IGNORECASE)
+    branch_match = re.search(r"\b(cse|ece|eee|mech|civil|it|ai\s*ml|ds|cs|ce|eie|aids)\b", text, re.IGNORECASE)
+    return {
+        "name_extracted": name_match.group(1).strip() if name_match else None,
+        "roll_number": roll_match.group(1) if roll_match else None,
+        "year": year_match.group(0) if year_match else None,
+        "course": course_match.group(0) if course_match else None,
+        "branch": branch_match.group(0).upper() if branch_match else None
+    }
+
+
+# Texts where one field's match overlaps another's (missing OCR tokens);
+# per-field search must still find both, as the legacy functions did
+OVERLAPPING_TEXTS = [
+    "roll no first year b.tech",
+    "name ravi kumar cse roll no 123 second year mba",
+    "roll no cse name priya sharma roll no 22a1 third year",
+    "name sai teja reddy roll no btech fourth year ece",
+]
+
+
+def synthetic_corpus(size, seed=0):
+    rng = random.Random(seed)
+    names = ["ravi kumar", "sai teja reddy", "priya sharma", "mohammed arif", "lakshmi devi"]
+    noise = ["identity card", "valid upto 2026", "principal", "blood group o+", "student", "signature"]
+    corpus = []
+    for _ in range(size):
+        parts = [rng.choice(noise), f"name {rng.choice(names)} roll no {rng.randint(10**9, 10**10)}",
+                 f"{rng.choice(['first', 'second', 'third', 'fourth'])} year",
+                 rng.choice(["btech", "b.tech", "mba", "msc"]), rng.choice(["cse", "ece", "mech", "it", "ai ml"]),
+                 rng.choice(noise)]
+        rng.shuffle(parts)
+        corpus.append(" ".join(parts))
+    return corpus + OVERLAPPING_TEXTS
+
+
+def benchmark(corpus, repeat=5):
+    """Texts/s of the legacy functions and the schema, and whether their output agrees.
+
+    Both do one re.search per field (the legacy calls hit re's pattern cache),
+    so the timings should be close; the point is identical output.
+    """
+    results = {}
+    for label, func in (("legacy", _legacy_extract), ("compiled", default_schema.extract)):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for text in corpus:
+                func(text)
+            best = min(best, time.perf_counter() - start)
+        results[label] = len(corpus) / best
+    agree = sum(_legacy_extract(t) == default_schema.extract(t) for t in corpus)
+    print(f"legacy:      {results['legacy']:.0f} texts/s")
+    print(f"compiled:    {results['compiled']:.0f} texts/s")
+    print(f"identical output on {agree}/{len(corpus)} texts")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the field schema against the legacy field functions")
+    parser.add_argument("--corpus", help="Text file with one OCR output per line (default: synthetic)")
+    parser.add_argument("--size", type=int, default=5000, help="Synthetic corpus size")
+    args = parser.parse_args()
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            corpus = [" ".join(line.split()).lower() for line in f if line.strip()] + OVERLAPPING_TEXTS
+    else:
+        corpus = synthetic_corpus(args.size)
+    benchmark(corpus)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,67 @@
-import base64
-import io
-from PIL import Image
+import logging
+
 import torch
-from torchvision import transforms, models
-import pytesseract
-import re
+from torchvision import models
+
+import model_registry
+from batching import batched
+from inference_backends import INFERENCE_BACKEND, load_exported, weight_files
+from combined_model import USE_COMBINED_MODEL, combined_forward
+from image_context import ImageContext, tensor_transform
+
+CLASSIFIER_MODEL_PATH = 'id_resnet_model.pth'
+
+logger = logging.getLogger(__name__)
 
 # Set device
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
-# Define the image transform (same as training)
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406],
-                         [0.229, 0.224, 0.225])
-])
+# Image transform (same as training)
+transform = tensor_transform
 
 # Load the model once, outside of predict function
-def load_model(path='id_resnet_model.pth'):
+def load_model(path=CLASSIFIER_MODEL_PATH, backend=INFERENCE_BACKEND):
+    # INT8 / ONNX Runtime export if selected and available (see export_models.py)
+    exported = load_exported(path, backend)
+    if exported is not None:
+        return exported
+
     model = models.resnet18(pretrained=False)
     model.fc = torch.nn.Linear(model.fc.in_features, 3)  # 3 classes
 
-    # Debug: Print sample weights before loading
-    print("Before loading weights:", model.fc.weight[0][:5])
+    # Debug: sample weights before loading
+    logger.debug("Before loading weights: %s", model.fc.weight[0][:5])
 
     # Load the trained weights
     state_dict = torch.load(path, map_location=device)
     model.load_state_dict(state_dict)
 
-    # Debug: Print sample weights after loading
-    print("After loading weights:", model.fc.weight[0][:5])
+    # Debug: sample weights after loading
+    logger.debug("After loading weights: %s", model.fc.weight[0][:5])
 
     model.to(device)
     model.eval()
     return model
 
-# Load model (do this once)
-model = load_model('id_resnet_model.pth')
-
-
-def correct_orientation(image: Image.Image):
-    osd = pytesseract.image_to_osd(image)
-    rotation = int(re.search(r'Rotate: (\d+)', osd).group(1))
-
-    if rotation != 0:
-        image = image.rotate(-rotation, expand=True)
-
-    return image
-
-# Predict from base64 encoded image string
-def predict_from_base64(image_base64: str):
-    image_data = base64.b64decode(image_base64)
-    image = Image.open(io.BytesIO(image_data)).convert('RGB')
-
-    # Correct the image orientation before preprocessing
-    image = correct_orientation(image)
-
-    img_t = transform(image).unsqueeze(0).to(device)  # Add batch dim
-
-    with torch.no_grad():
-        outputs = model(img_t)  # raw logits
-        probabilities = torch.nn.functional.softmax(outputs, dim=1)
+# Load model once per worker (via the shared registry)
+if not USE_COMBINED_MODEL:
+    model_registry.register("classifier", lambda: load_model(CLASSIFIER_MODEL_PATH),
+                            fork_safe=INFERENCE_BACKEND != "onnx", files=weight_files(CLASSIFIER_MODEL_PATH))
+    model_registry.register("classifier_runner",
+                            lambda: batched(model_registry.get("classifier"), device, name="classifier-batcher"),
+                            fork_safe=False)
+
+
+# Predict from a decoded, request-scoped image
+def predict_from_context(image: ImageContext):
+    if USE_COMBINED_MODEL:
+        outputs, _ = combined_forward(image)  # Shared with the template validator
+    else:
+        img_t = image.oriented_tensor.to(device)  # Orientation-corrected, batch dim included
+        model = model_registry.get("classifier_runner")  # Micro-batched across requests
+        with image.timer("classifier"), torch.no_grad():
+            outputs = model(img_t)  # raw logits
+    probabilities = torch.nn.functional.softmax(outputs, dim=1)
 
     class_names = ['fake', 'genuine', 'non-id']  # updated here
     genuine_index = class_names.index('genuine')
@@ -74,3 +74,7 @@ def predict_from_base64(image_base64: str):
             class_names[i]: round(prob.item(), 4) for i, prob in enumerate(probabilities[0])
         }
     }
+
+# Predict from base64 encoded image string
+def predict_from_base64(image_base64: str):
+    return predict_from_context(ImageContext.from_base64(image_base64))
@@ -0,0 +1,188 @@
+import base64
+import io
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+from torchvision import transforms
+
+import ocr_engine
+from crop import crop_card
+
+logger = logging.getLogger(__name__)
+
+# Same preprocessing as training (train.py / template_train.py)
+tensor_transform = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize([0.485, 0.456, 0.406],
+                         [0.229, 0.224, 0.225])
+])
+
+
+# Skip Tesseract OSD for landscape images whose EXIF doesn't ask for a rotation.
+# ID cards are landscape, so these are almost always upright already.
+SKIP_OSD_WHEN_UPRIGHT = os.environ.get("SKIP_OSD_WHEN_UPRIGHT", "1") == "1"
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+# Detect and warp the card out of the photo before any other stage
+CROP_CARD = os.environ.get("CROP_CARD", "1") == "1"
+
+# angle: clockwise degrees the image was rotated by; source: exif/aspect/osd/failed
+Orientation = namedtuple("Orientation", ["angle", "image", "source"])
+
+
+def detect_orientation(image: Image.Image, skip_if_upright=SKIP_OSD_WHEN_UPRIGHT):
+    """Rotate `image` upright, running Tesseract OSD only when it's needed."""
+    exif_orientation = 1
+    try:
+        exif_orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+    except Exception:
+        pass
+    if exif_orientation != 1:
+        image = ImageOps.exif_transpose(image)
+        source = "exif"
+    else:
+        source = "aspect"
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    if skip_if_upright and image.width >= image.height:
+        return Orientation(0, image, source)
+
+    try:
+        rotation = ocr_engine.detect_rotation(image)
+        if rotation != 0:
+            image = image.rotate(-rotation, expand=True)
+        return Orientation(rotation, image, "osd")
+    except Exception as e:
+        logger.warning("Rotation detection failed: %s", e)
+        return Orientation(0, image, "failed")
+
+
+def correct_orientation(image: Image.Image):
+    return detect_orientation(image).image
+
+
+class ImageContext:
+    """Request-scoped image: decoded once, derived views computed lazily.
+
+    Every validator receives the same context so the base64 decode, PIL open,
+    card crop, orientation detection and tensor conversion each happen at most
+    once. Views derive from each other in that order: upload -> EXIF-upright
+    RGB -> card crop -> OSD orientation -> grayscale / tensors.
+    """
+
+    def __init__(self, image_bytes: bytes):
+        self.image_bytes = image_bytes
+        self.image = Image.open(io.BytesIO(image_bytes))
+        self._cache = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        # Seconds spent per stage on this request (see timer)
+        self.timings = {}
+
+    @classmethod
+    def from_base64(cls, base64_string: str):
+        return cls(base64.b64decode(base64_string))
+
+    def memo(self, key, build):
+        """Return the cached value for `key`, building it once if needed."""
+        # Validators run concurrently, so each view is built under its own lock
+        if key in self._cache:
+            return self._cache[key]
+        with self._locks_guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._cache:
+                self._cache[key] = build()
+        return self._cache[key]
+
+    def peek(self, key, default=None):
+        """Cached value for `key` if it was already built, without building it."""
+        return self._cache.get(key, default)
+
+    @contextmanager
+    def timer(self, stage):
+        """Add the time spent in the block to this request's `timings[stage]`."""
+        # Resolve the views a stage needs before entering, so waits on other stages aren't counted
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0.0) + time.perf_counter() - start
+
+    @property
+    def width(self):
+        return self.image.width
+
+    @property
+    def height(self):
+        return self.image.height
+
+    @property
+    def upright(self) -> Image.Image:
+        """RGB image with the EXIF orientation applied."""
+        def build():
+            with self.timer("decode"):
+                return ImageOps.exif_transpose(self.image).convert('RGB')
+        return self.memo("upright", build)
+
+    @property
+    def card_crop(self):
+        """Perspective-corrected card array, or None if no card outline was found."""
+        def build():
+            if not CROP_CARD:
+                return None
+            try:
+                upright = np.asarray(self.upright)
+                with self.timer("card_crop"):
+                    return crop_card(upright)
+            except Exception as e:
+                logger.warning("Card crop failed: %s", e)
+                return None
+        return self.memo("card_crop", build)
+
+    @property
+    def card(self) -> Image.Image:
+        """Card-only RGB image (falls back to the whole photo)."""
+        def build():
+            crop = self.card_crop
+            return Image.fromarray(crop) if crop is not None else self.upright
+        return self.memo("card", build)
+
+    @property
+    def orientation(self) -> Orientation:
+        """Orientation stage result, computed once and shared by every validator."""
+        def build():
+            card = self.card
+            with self.timer("orientation"):
+                return detect_orientation(card)
+        return self.memo("orientation", build)
+
+    @property
+    def oriented(self) -> Image.Image:
+        """Card image rotated upright (EXIF, then Tesseract OSD if needed)."""
+        return self.orientation.image
+
+    @property
+    def gray(self) -> np.ndarray:
+        """Grayscale OpenCV array of the oriented card."""
+        return self.memo("gray", lambda: cv2.cvtColor(np.array(self.oriented), cv2.COLOR_RGB2GRAY))
+
+    @property
+    def tensor(self):
+        """224x224 normalized tensor (with batch dim) of the card before OSD rotation."""
+        return self.memo("tensor", lambda: tensor_transform(self.card).unsqueeze(0))
+
+    @property
+    def oriented_tensor(self):
+        """224x224 normalized tensor (with batch dim) of the oriented card."""
+        return self.memo("oriented_tensor", lambda: tensor_transform(self.oriented).unsqueeze(0))
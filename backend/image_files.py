@@ -0,0 +1,18 @@
+import os
+
+# Image files the training, export, enrollment and batch tools pick up from a directory
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def is_image_file(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def image_files(root, recursive=False):
+    """Image files directly under `root` (or anywhere below it if `recursive`), sorted."""
+    if not recursive:
+        return sorted(os.path.join(root, n) for n in os.listdir(root) if is_image_file(n))
+    files = []
+    for dirpath, _, names in os.walk(root):
+        files.extend(os.path.join(dirpath, n) for n in names if is_image_file(n))
+    return sorted(files)
@@ -0,0 +1,113 @@
+import logging
+import os
+
+import numpy as np
+import torch
+
+# Backend for the ResNet forward passes: "torch" (float32), "quantized"
+# (INT8 TorchScript, static post-training quantization) or "onnx" (ONNX Runtime)
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")
+# Intra-op threads per process for torch and ONNX Runtime (0 = library default)
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", "0"))
+
+
+def set_inference_threads(threads):
+    """Intra-op thread limit for this process (serve.py calls it in each forked worker)."""
+    global INFERENCE_THREADS
+    INFERENCE_THREADS = threads
+    if threads > 0:
+        torch.set_num_threads(threads)
+
+
+set_inference_threads(INFERENCE_THREADS)
+
+logger = logging.getLogger(__name__)
+
+EXPORT_SUFFIXES = {
+    "quantized": ".int8.pt",
+    "onnx": ".onnx",
+}
+
+
+def exported_path(path, backend):
+    """Where the exported copy of the `.pth` weights at `path` lives for `backend`."""
+    return os.path.splitext(path)[0] + EXPORT_SUFFIXES[backend]
+
+
+def weight_files(path, backend=INFERENCE_BACKEND):
+    """The files load_exported() may read for `path`: the weights plus their export for `backend`."""
+    return [path] if backend == "torch" else [path, exported_path(path, backend)]
+
+
+class QuantizedModel:
+    """INT8 TorchScript model; quantized kernels are CPU-only."""
+
+    def __init__(self, path):
+        torch.backends.quantized.engine = "fbgemm" if "fbgemm" in torch.backends.quantized.supported_engines \
+            else torch.backends.quantized.supported_engines[-1]
+        self.module = torch.jit.load(path, map_location="cpu")
+        self.module.eval()
+
+    def __call__(self, batch):
+        return self.module(batch.cpu())
+
+
+class OnnxModel:
+    """ONNX Runtime session called like a torch module (tensor in, tensor out)."""
+
+    def __init__(self, path):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if INFERENCE_THREADS > 0:
+            options.intra_op_num_threads = INFERENCE_THREADS
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        inputs = np.ascontiguousarray(batch.detach().cpu().numpy(), dtype=np.float32)
+        return torch.from_numpy(self.session.run(None, {self.input_name: inputs})[0])
+
+
+def load_exported(path, backend=INFERENCE_BACKEND):
+    """Exported model for the weights at `path`, or None if it hasn't been exported."""
+    if backend == "torch":
+        return None
+    export = exported_path(path, backend)
+    if not os.path.exists(export):
+        logger.warning("No %s export at %s, using the float32 torch model", backend, export)
+        return None
+    return QuantizedModel(export) if backend == "quantized" else OnnxModel(export)
+
+
+# --- Export (used by export_models.py) ---
+
+def export_quantized(quantizable_model, calibration_batches, out_path):
+    """Static INT8 post-training quantization of a torchvision quantizable ResNet."""
+    from torch.ao import quantization
+    engine = "fbgemm" if "fbgemm" in torch.backends.quantized.supported_engines else "qnnpack"
+    torch.backends.quantized.engine = engine
+
+    model = quantizable_model.cpu().eval()
+    model.fuse_model()
+    model.qconfig = quantization.get_default_qconfig(engine)
+    quantization.prepare(model, inplace=True)
+    with torch.no_grad():
+        for batch in calibration_batches:
+            model(batch)
+    quantization.convert(model, inplace=True)
+    torch.jit.save(torch.jit.script(model), out_path)
+    return out_path
+
+
+def export_onnx(model, out_path, quantize=True):
+    """ONNX export with a dynamic batch axis, optionally INT8 weight-quantized for ONNX Runtime."""
+    model = model.cpu().eval()
+    dummy = torch.randn(1, 3, 224, 224)
+    float_path = out_path if not quantize else os.path.splitext(out_path)[0] + ".fp32.onnx"
+    torch.onnx.export(model, dummy, float_path, input_names=["input"], output_names=["output"],
+                      dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}}, opset_version=17)
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(float_path, out_path, weight_type=QuantType.QInt8)
+    return out_path
@@ -1,16 +1,29 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 
-import base64
+import hmac
+import io
+import json
+import logging
+import os
+from typing import List, Optional
 
-# Import your OCR + text validation function
-from ocr_validator import run_text_validation  
-from template_validator import validation_score_from_base64
+from PIL import Image
+from starlette.concurrency import run_in_threadpool
 
-# Import your image classification function and model loader
-from image_classifier import predict_from_base64
+# Leveled logging; per-request debug output (embeddings, matches) only at LOG_LEVEL=DEBUG
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+# Validation pipeline (imports and registers all validators)
+from pipeline import RESPONSE_TIMINGS, run_validation, validate_many
+
+import metrics
+import model_registry
+import template_enrollment
+from upload import InvalidUpload, UploadTooLarge, check_declared_size, iter_upload_file, read_capped
 
 app = FastAPI(
     title="College ID Validator API",
@@ -26,6 +39,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def warm_up_models():
+    # Load every model/embedding once so the first request doesn't pay for it
+    model_registry.warm_up()
+
+@app.on_event("shutdown")
+async def flush_metrics():
+    # Leave this worker's final counts for the other workers' /metrics
+    if metrics.METRICS_DIR:
+        metrics.write_snapshot()
+
 class IDValidationRequest(BaseModel):
     user_id: str
     image_base64: str
@@ -40,6 +64,9 @@ async def root():
         <body>
             <h1>Welcome to the College ID Validator API</h1>
             <p>Use the <code>/validate-id</code> POST endpoint to validate ID cards.</p>
+            <p>Use <code>/validate-id/upload</code> to send the raw image (multipart or octet-stream) instead of base64.</p>
+            <p>Use <code>/validate-id/batch</code> to validate many cards at once (NDJSON response).</p>
+            <p>Add <code>?timings=true</code> to get per-stage timings; Prometheus metrics are on <code>/metrics</code>.</p>
             <p>Go to <a href="/docs">/docs</a> for API documentation.</p>
         </body>
     </html>
@@ -48,128 +75,133 @@ async def root():
 from fastapi.responses import JSONResponse
 
 @app.post("/validate-id")
-async def validate_id(data: IDValidationRequest):
-    # --- Default values to avoid UnboundLocalError ---
-    genuine_confidence = 0.0
-    all_probabilities = {}
-    predicted_class = "unknown"
-    template_score = 0.0
-    ocr_results = {"ocr_confidence": 0.0, "is_fake": True, "validation": {}, "extracted_text": ""}
-    face_photo_found = False  # NEW
-
+async def validate_id(data: IDValidationRequest, timings: bool = RESPONSE_TIMINGS):
+    return await run_validation(data.user_id, image_base64=data.image_base64, include_timings=timings)
+
+async def read_multipart_form(request: Request):
+    # The form parser spools the whole body before any file can be read,
+    # so the declared size is the only cap it gets
+    if check_declared_size(request.headers.get("content-length")) is None:
+        raise HTTPException(status_code=411, detail="Multipart uploads need a Content-Length header")
+    return await request.form()
+
+@app.post("/validate-id/upload")
+async def validate_id_upload(request: Request, user_id: Optional[str] = None, timings: bool = RESPONSE_TIMINGS):
+    # Raw image upload: multipart/form-data (fields "file", "user_id") or
+    # application/octet-stream with ?user_id=... -- no base64 inflation
     try:
-        # --- Image-based prediction ---
-        try:
-            result = predict_from_base64(data.image_base64)
-            genuine_confidence = float(result.get("genuine_confidence", 0))
-            all_probabilities = result.get("all_probabilities", {})
-            predicted_class = max(all_probabilities, key=all_probabilities.get) if all_probabilities else "unknown"
-        except Exception as e_img:
-            print(f"Image prediction error: {e_img}")
-
-        # --- Template similarity score ---
-        try:
-            template_score = float(validation_score_from_base64(data.image_base64))
-        except Exception as e_temp:
-            print(f"Template validation error: {e_temp}")
-
-        # --- OCR Validation ---
-        try:
-            ocr_results = run_text_validation(data.image_base64, data.user_id)
-        except Exception as e_ocr:
-            print(f"OCR error: {e_ocr}")
-
-        ocr_confidence = float(ocr_results.get("ocr_confidence", 0))
-        is_fake_based_on_ocr = ocr_results.get("is_fake", True)
-        face_photo_found = ocr_results.get("validation", {}).get("face_photo_found", False)  # NEW
-
-        # --- Combined Validation Score ---
-        weight_image = 0.3
-        weight_ocr = 0.3
-        weight_template = 0.4
-        validation_score = round(
-            weight_image * genuine_confidence +
-            weight_ocr * ocr_confidence +
-            weight_template * template_score,
-            4
-        )
-
-        # --- Decision logic ---
-        threshold = 0.7
-        if not face_photo_found:
-            label = "fake"
-            status = "rejected"
-            reason = "Face photo not found in ID card"
-        elif ocr_confidence == 0.0 or validation_score < 0.6:
-            label = "fake"
-            status = "rejected"
-            reason = "OCR failed completely or validation score is too low"
-        elif validation_score > 0.85:
-            label = "genuine"
-            status = "approved"
-            reason = "High confidence from all validators (image, OCR, template)"
-        elif 0.6 <= validation_score <= 0.85 or ocr_confidence < 0.6:
-            label = "suspicious"
-            status = "manual_review"
-            reason = "Moderate score or low OCR confidence"
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            form = await read_multipart_form(request)
+            user_id = form.get("user_id", user_id)
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=422, detail="Multipart upload needs a 'file' field")
+            image_bytes = await read_capped(iter_upload_file(upload))
+            await upload.close()
         else:
-            label = "suspicious"
-            status = "manual_review"
-            reason = "Uncertain case, needs manual review"
-
-        return {
-            "status": "success",
-            "message": "Validation completed",
-            "user_id": data.user_id,
-            "validation_score": float(validation_score),
-            "threshold": float(threshold),
-            "label": label,
-            "action": status,
-            "reason": reason,
-            "image_classification": {
-                "predicted_class": predicted_class,
-                "genuine_confidence": round(genuine_confidence, 4),
-                "all_probabilities": {
-                    k: round(float(v), 4) for k, v in all_probabilities.items()
-                },
-                "template_similarity_score": round(template_score, 4)
-            },
-            "text_validation": ocr_results.get("validation", {}),
-            "extracted_text": ocr_results.get("extracted_text", ""),
-            "ocr_confidence": round(ocr_confidence, 4),
-            "is_fake_based_on_ocr": is_fake_based_on_ocr
-        }
-
-    except Exception as e:
-        print(f"Unexpected error: {e}")
-        return {
-            "status": "error",
-            "message": "Unexpected error during processing",
-            "user_id": data.user_id,
-            "validation_score": 0.0,
-            "threshold": 0.7,
-            "label": "unknown",
-            "action": "manual_review",
-            "reason": "Exception occurred during processing",
-            "image_classification": {
-                "predicted_class": predicted_class,
-                "genuine_confidence": round(genuine_confidence, 4),
-                "all_probabilities": {
-                    k: round(float(v), 4) for k, v in all_probabilities.items()
-                },
-                "template_similarity_score": round(template_score, 4)
-            },
-            "text_validation": {},
-            "extracted_text": "",
-            "ocr_confidence": 0.0,
-            "is_fake_based_on_ocr": True
-        }
-
+            check_declared_size(request.headers.get("content-length"))
+            image_bytes = await read_capped(request.stream())
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not user_id:
+        raise HTTPException(status_code=422, detail="user_id is required")
+    return await run_validation(user_id, image_bytes=image_bytes, include_timings=timings)
+
+class IDValidationBatchRequest(BaseModel):
+    items: List[IDValidationRequest]
+
+# Larger jobs go through validate_batch.py, which reads images from disk as it goes
+MAX_BATCH_ITEMS = int(os.environ.get("MAX_BATCH_ITEMS", "100"))
+
+@app.post("/validate-id/batch")
+async def validate_id_batch(data: IDValidationBatchRequest):
+    if len(data.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch of {len(data.items)} items exceeds the {MAX_BATCH_ITEMS} item limit")
+
+    # One NDJSON line per item, streamed in completion order
+    async def stream():
+        items = [(item.user_id, item.image_base64, None) for item in data.items]
+        async for index, result in validate_many(items):
+            yield json.dumps({"index": index, **result}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+# Template enrollment endpoints are disabled unless a token is configured
+ENROLLMENT_TOKEN = os.environ.get("ENROLLMENT_TOKEN")
+
+def check_enrollment_token(token):
+    # Constant-time comparison so response timing doesn't leak the token
+    if not ENROLLMENT_TOKEN or not hmac.compare_digest((token or "").encode(), ENROLLMENT_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Template enrollment is not allowed")
+
+@app.get("/templates")
+async def list_templates():
+    templates = model_registry.get("template_store").current()
+    return {"version": templates.version, "count": len(templates), "templates": templates.templates}
+
+@app.post("/templates")
+async def enroll_templates(request: Request, x_enrollment_token: Optional[str] = Header(None)):
+    # multipart/form-data: one or more "file" fields, optional "college" and "layout_id"
+    check_enrollment_token(x_enrollment_token)
+    try:
+        form = await read_multipart_form(request)
+        uploads = [f for f in form.getlist("file") if not isinstance(f, str)]
+        if not uploads:
+            raise HTTPException(status_code=422, detail="Multipart upload needs at least one 'file' field")
+        images, names = [], []
+        for i, upload in enumerate(uploads):
+            name = os.path.basename(upload.filename or f"upload-{i}.jpg")
+            data = await read_capped(iter_upload_file(upload))
+            await upload.close()
+            try:
+                image = Image.open(io.BytesIO(data))
+                image.load()  # Decode now, so a bad file fails here rather than during enrollment
+            except OSError as e:  # PIL.UnidentifiedImageError, truncated images
+                raise HTTPException(status_code=400, detail=f"'{name}' is not a readable image: {e}")
+            images.append(image)
+            names.append(name)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+    try:
+        summary = await run_in_threadpool(template_enrollment.enroll, images, names,
+                                          form.get("college"), form.get("layout_id"))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    model_registry.get("template_store").reload()  # Other workers pick it up on their next poll
+    return summary
+
+@app.delete("/templates")
+async def remove_templates(file: List[str] = Query([]), college: Optional[str] = None,
+                           x_enrollment_token: Optional[str] = Header(None)):
+    check_enrollment_token(x_enrollment_token)
+    if not file and not college:
+        raise HTTPException(status_code=422, detail="Pass file=... and/or college=...")
+    try:
+        summary = await run_in_threadpool(template_enrollment.remove, file, college)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    model_registry.get("template_store").reload()
+    return summary
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
+    if not model_registry.is_ready():
+        return JSONResponse(
+            status_code=503,
+            content={"status": "loading", "models": model_registry.status()}
+        )
+    return {"status": "ok", "models": model_registry.status()}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    # Prometheus text exposition format
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/version")
 async def version_info():
@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# In-process metrics in the Prometheus text exposition format, served on /metrics.
+# A scrape reaches only one worker, so under serve.py (METRICS_DIR set) each
+# worker also writes its values to a file in METRICS_DIR and /metrics serves
+# the merge of every file: counters and histograms summed across workers
+# (including ones that have since exited, so totals never go backwards),
+# gauges as the maximum.
+METRICS_DIR = os.environ.get("METRICS_DIR")
+# How often a worker rewrites its file; a scrape also writes the scraping worker's
+METRICS_FLUSH_S = float(os.environ.get("METRICS_FLUSH_S", "1"))
+
+# Stage latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def merge(self, snapshots):
+        """{label values: value} combining the snapshots of several processes."""
+        values = {}
+        for snapshot in snapshots:
+            for key, value in snapshot:
+                key = tuple(key)
+                values[key] = self._combine(values[key], value) if key in values else value
+        return values
+
+    def _combine(self, a, b):
+        return a + b
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        if values is None:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _combine(self, a, b):
+        return max(a, b)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; each label set keeps (bucket counts, sum, count)."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), [list(counts), total, count]] for key, (counts, total, count) in self._values.items()]
+
+    def _combine(self, a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1], a[2] + b[2]]
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        if values is None:
+            with self._lock:
+                values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                le = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{le} {bucket_count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def snapshot():
+    return {metric.name: metric.snapshot() for metric in _metrics}
+
+
+_snapshot_names = {}
+
+
+def _snapshot_name():
+    # Unique per process even if a restarted worker reuses a dead one's pid
+    pid = os.getpid()
+    if pid not in _snapshot_names:
+        _snapshot_names[pid] = f"{pid}-{time.time_ns()}.json"
+    return _snapshot_names[pid]
+
+
+def write_snapshot(directory=METRICS_DIR):
+    """Write this process's values to its own file in `directory` (atomically)."""
+    path = os.path.join(directory, _snapshot_name())
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def read_snapshots(directory=METRICS_DIR):
+    snapshots = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning("Skipping unreadable metrics file %s: %s", name, e)
+    return snapshots
+
+
+def start_exporter(directory=METRICS_DIR, interval=METRICS_FLUSH_S):
+    """Keep this process's metrics file current (call once per worker, after fork)."""
+    def run():
+        while True:
+            try:
+                write_snapshot(directory)
+            except OSError as e:
+                logger.warning("Could not write metrics to %s: %s", directory, e)
+            time.sleep(interval)
+
+    threading.Thread(target=run, name="metrics-exporter", daemon=True).start()
+
+
+def render():
+    """All metrics in the Prometheus text format (version 0.0.4), merged across workers under METRICS_DIR."""
+    lines = []
+    if METRICS_DIR:
+        write_snapshot(METRICS_DIR)
+        snapshots = read_snapshots(METRICS_DIR)
+        for metric in _metrics:
+            lines.extend(metric.render(metric.merge(s.get(metric.name, []) for s in snapshots)))
+    else:
+        for metric in _metrics:
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Validation metrics ---
+
+STAGE_SECONDS = Histogram(
+    "id_validator_stage_seconds", "Time spent in each validation stage", ["stage"]
+)
+REQUEST_SECONDS = Histogram(
+    "id_validator_request_seconds", "End-to-end validation latency", ["label"]
+)
+REQUESTS = Counter(
+    "id_validator_requests_total", "Validations by outcome", ["label", "action"]
+)
+CACHE_LOOKUPS = Counter(
+    "id_validator_result_cache_total", "Result cache lookups", ["result"]
+)
+SKIPPED_STAGES = Counter(
+    "id_validator_skipped_stages_total", "Stages skipped by the early-exit cascade", ["stage"]
+)
+STAGE_FAILURES = Counter(
+    "id_validator_stage_failures_total", "Stages that timed out or raised", ["stage", "reason"]
+)
+MODEL_LOAD_SECONDS = Gauge(
+    "id_validator_model_load_seconds", "Time taken to load each registered model or index", ["model"]
+)
+
+
+def observe_stages(timings):
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
@@ -0,0 +1,104 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Process-wide registry of heavy assets (models, embedding matrices).
+# Each validator registers a loader at import time; the asset is built the
+# first time it is requested and then kept for the lifetime of the worker.
+_loaders = {}
+_assets = {}
+# name -> files the asset is built from, and their fingerprint when it was loaded
+_files = {}
+_loaded_versions = {}
+# Assets that start threads or native thread pools; these can't be built before fork (serve.py)
+_per_process = set()
+# Re-entrant: a loader may itself get() the assets it wraps
+_lock = threading.RLock()
+
+
+def files_version(paths):
+    """Fingerprint of files by size and mtime; changes whenever any of them is replaced."""
+    parts = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            parts.append(f"{path}:{stat.st_size}:{stat.st_mtime_ns}")
+        except OSError:
+            parts.append(f"{path}:missing")
+    return hashlib.blake2b("|".join(parts).encode(), digest_size=8).hexdigest()
+
+
+def register(name, loader, fork_safe=True, files=()):
+    """Register a zero-argument callable that builds the asset `name`.
+
+    Pass fork_safe=False for assets that own threads (batch schedulers, ONNX
+    Runtime sessions); the preforking server loads those in each worker.
+    `files` are the weights/data files the loader reads; version() reports
+    them as they were when the asset was loaded.
+    """
+    _loaders[name] = loader
+    _files[name] = tuple(files)
+    if not fork_safe:
+        _per_process.add(name)
+
+
+def get(name):
+    """Return the asset `name`, loading it once if it is not resident yet."""
+    asset = _assets.get(name)
+    if asset is not None:
+        return asset
+
+    with _lock:
+        # Another thread may have finished loading while we waited
+        if name not in _assets:
+            if name not in _loaders:
+                raise KeyError(f"No loader registered for '{name}'")
+            start = time.perf_counter()
+            # Fingerprint before loading, so a file replaced mid-load reads as changed later
+            version = files_version(_files[name])
+            asset = _loaders[name]()
+            _loaded_versions[name] = version
+            _assets[name] = asset
+            elapsed = time.perf_counter() - start
+            metrics.MODEL_LOAD_SECONDS.set(elapsed, model=name)
+            logger.info("Loaded '%s' in %.2fs", name, elapsed)
+        return _assets[name]
+
+
+def warm_up(fork_safe_only=False):
+    """Load every registered asset. Called once at application startup.
+
+    With fork_safe_only, only the assets that can be shared copy-on-write with
+    forked workers are loaded (the preforking parent in serve.py).
+    """
+    for name in list(_loaders):
+        if not (fork_safe_only and name in _per_process):
+            get(name)
+
+
+def version():
+    """Fingerprint of the weights this process serves.
+
+    Loaded assets count as the files they were loaded from, not the files on
+    disk now: a retrained model only takes effect once the process restarts.
+    Assets not loaded yet count as their current files.
+    """
+    parts = []
+    for name in sorted(_files):
+        if _files[name]:
+            parts.append(f"{name}={_loaded_versions.get(name) or files_version(_files[name])}")
+    return hashlib.blake2b("|".join(parts).encode(), digest_size=8).hexdigest()
+
+
+def is_ready():
+    return bool(_loaders) and all(name in _assets for name in _loaders)
+
+
+def status():
+    return {name: name in _assets for name in _loaders}
@@ -0,0 +1,117 @@
+import logging
+import os
+import re
+import threading
+
+import pytesseract
+
+logger = logging.getLogger(__name__)
+
+# OCR backend: "auto" uses tesserocr (libtesseract, no subprocess) when installed,
+# otherwise the pytesseract CLI wrapper.
+OCR_BACKEND = os.environ.get("OCR_BACKEND", "auto")  # auto | tesserocr | pytesseract
+TESSERACT_LANG = os.environ.get("TESSERACT_LANG", "eng")
+WINDOWS_TESSERACT_CMD = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+
+# Path to Tesseract: TESSERACT_CMD, else the default Windows install if present, else PATH
+TESSERACT_CMD = os.environ.get("TESSERACT_CMD")
+if TESSERACT_CMD is None and os.name == "nt" and os.path.exists(WINDOWS_TESSERACT_CMD):
+    TESSERACT_CMD = WINDOWS_TESSERACT_CMD
+if TESSERACT_CMD:
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+
+
+class PytesseractEngine:
+    """Runs the tesseract binary once per call (process start + language load each time)."""
+
+    name = "pytesseract"
+
+    def image_to_data(self, image):
+        data = pytesseract.image_to_data(image, lang=TESSERACT_LANG, output_type=pytesseract.Output.DICT)
+        return {"text": data["text"], "conf": data["conf"]}
+
+    def detect_rotation(self, image):
+        osd = pytesseract.image_to_osd(image)
+        return int(re.search(r'Rotate: (\d+)', osd).group(1))
+
+
+class TesserocrEngine:
+    """libtesseract API handles kept warm, one per thread (the API isn't thread-safe).
+
+    Validator threads come from bounded pools, so this is effectively a pool
+    of long-lived engines with the language data loaded once per thread.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self):
+        import tesserocr
+        self.tesserocr = tesserocr
+        self._local = threading.local()
+
+    def _api(self, key, **kwargs):
+        api = getattr(self._local, key, None)
+        if api is None:
+            api = self.tesserocr.PyTessBaseAPI(lang=TESSERACT_LANG, **kwargs)
+            setattr(self._local, key, api)
+        return api
+
+    def image_to_data(self, image):
+        tesserocr = self.tesserocr
+        api = self._api("ocr_api")
+        api.SetImage(image)
+        api.Recognize()
+        texts, confs = [], []
+        iterator = api.GetIterator()
+        level = tesserocr.RIL.WORD
+        for word in tesserocr.iterate_level(iterator, level):
+            text = word.GetUTF8Text(level)
+            if text:
+                texts.append(text)
+                confs.append(int(word.Confidence(level)))
+        api.Clear()
+        return {"text": texts, "conf": confs}
+
+    def detect_rotation(self, image):
+        api = self._api("osd_api", psm=self.tesserocr.PSM.OSD_ONLY)
+        api.SetImage(image)
+        result = api.DetectOrientationScript()
+        api.Clear()
+        # "Orientation in degrees" -> clockwise rotation needed, as in pytesseract's "Rotate:"
+        return (360 - int(result["orient_deg"])) % 360
+
+
+def _create_engine(backend=OCR_BACKEND):
+    if backend in ("auto", "tesserocr"):
+        try:
+            return TesserocrEngine()
+        except ImportError:
+            if backend == "tesserocr":
+                logger.warning("tesserocr not installed, falling back to pytesseract")
+    return PytesseractEngine()
+
+
+engine = _create_engine()
+fallback_engine = PytesseractEngine()
+
+
+def image_to_data(image):
+    """Word texts and confidences ({"text": [...], "conf": [...]}) for a PIL image."""
+    try:
+        return engine.image_to_data(image)
+    except Exception as e:
+        if engine is fallback_engine:
+            raise
+        logger.warning("%s OCR failed, using pytesseract: %s", engine.name, e)
+        return fallback_engine.image_to_data(image)
+
+
+def detect_rotation(image):
+    """Clockwise rotation in degrees that makes `image` upright (Tesseract OSD)."""
+    try:
+        return engine.detect_rotation(image)
+    except Exception as e:
+        if engine is fallback_engine:
+            raise
+        logger.warning("%s OSD failed, using pytesseract: %s", engine.name, e)
+        return fallback_engine.detect_rotation(image)
@@ -1,62 +1,43 @@
 from PIL import Image
-import pytesseract
-import base64
-import io
-import re
-import cv2
+import logging
 import numpy as np
-from rapidfuzz import fuzz
-
-# Path to Tesseract
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-
-# List of known colleges
-KNOWN_COLLEGES = [
-    "JNTU Hyderabad", "IIT Hyderabad", "IIT Madras", "BITS Pilani Hyderabad Campus",
-    "NIT Warangal", "Osmania University", "Vasavi College of Engineering",
-    "CBIT (Chaitanya Bharathi Institute of Technology)", "MVSR Engineering College",
-    "Gokaraju Rangaraju Institute of Engineering and Technology (GRIET)",
-    "VNR Vignana Jyothi Institute of Engineering and Technology", "CVR College of Engineering",
-    "SNIST (Sreenidhi Institute of Science and Technology)", "Anurag University", "Mahindra University",
-    "IIIT Hyderabad", "MGIT (Mahatma Gandhi Institute of Technology)", "KMIT (Keshav Memorial Institute of Technology)",
-    "ACE Engineering College", "CMR College of Engineering and Technology",
-    "Holy Mary Institute of Technology & Science", "TKR College of Engineering and Technology",
-    "Nalla Malla Reddy Engineering College", "ICFAI Foundation for Higher Education (IFHE)",
-    "Maturi Venkata Subba Rao Engineering College (MVSR)", "University College of Engineering Osmania (UCE OU)",
-    "Malla Reddy Engineering College", "Malla Reddy Engineering College for Women",
-    "Malla Reddy Institute of Technology and Science (MRITS)", "Malla Reddy College of Engineering",
-    "Malla Reddy College of Engineering and Technology (MRCET)", "Malla Reddy Institute of Engineering and Technology (MRIET)",
-    "Malla Reddy College of Pharmacy", "Malla Reddy Institute of Management", "Malla Reddy University"
-]
-
-# Load face detector
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
-
-def correct_orientation(image: Image.Image, save_path="corrected_image.jpg"):
-    try:
-        osd = pytesseract.image_to_osd(image)
-        rotation = int(re.search(r'Rotate: (\d+)', osd).group(1))
-        if rotation != 0:
-            image = image.rotate(-rotation, expand=True)
-        if image.mode == "RGBA":
-            image = image.convert("RGB")
-        image.save(save_path)
-    except Exception as e:
-        print(f"Rotation detection failed: {e}")
-    return image
+
+import face_detector
+import ocr_engine
+from college_matcher import COLLEGE_REGISTRY_PATH, CollegeMatcher
+from field_extractor import extract_fields, register_college_schema
+from image_context import ImageContext, detect_orientation
+from roi_ocr import extract_text_from_regions, layout_for
+
+logger = logging.getLogger(__name__)
+
+# Tesseract binary/backend are configured in ocr_engine (TESSERACT_CMD, OCR_BACKEND)
+
+# Known colleges, compiled once from the external registry (colleges.json)
+college_matcher = CollegeMatcher.from_file(COLLEGE_REGISTRY_PATH)
+KNOWN_COLLEGES = college_matcher.names
+
+# Optional per-college field patterns ("fields": {field: regex}) from the registry
+for college in college_matcher.colleges:
+    if college.get("fields"):
+        register_college_schema(college["name"], college["fields"])
+
+# Face detector (Haar or optional DNN) lives in face_detector
+face_cascade = face_detector.face_cascade
+
+def correct_orientation(image: Image.Image):
+    return detect_orientation(image).image
 
 def decode_base64_image(base64_string):
     try:
-        image_data = base64.b64decode(base64_string)
-        image = Image.open(io.BytesIO(image_data))
-        return correct_orientation(image)
+        return ImageContext.from_base64(base64_string).oriented
     except Exception as e:
-        print(f"Error decoding image: {e}")
+        logger.warning("Error decoding image: %s", e)
         return None
 
 def extract_text_with_confidence(image):
     try:
-        ocr_data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+        ocr_data = ocr_engine.image_to_data(image)
         texts = ocr_data['text']
         confs = ocr_data['conf']
         valid_confs = [int(conf) for conf, txt in zip(confs, texts) if txt.strip() and conf != '-1']
@@ -64,68 +45,63 @@ def extract_text_with_confidence(image):
         full_text = " ".join([txt for txt in texts if txt.strip()])
         return full_text, avg_conf
     except Exception as e:
-        print(f"OCR error: {e}")
+        logger.warning("OCR error: %s", e)
         return "", 0
 
+def extract_text_for_context(context):
+    # OCR only the matched template's text regions; full image when there is no confident match
+    try:
+        layout_for(context)  # Template match outside the OCR timer
+    except Exception:
+        pass
+    image = context.oriented
+    with context.timer("ocr"):
+        try:
+            regions = extract_text_from_regions(context)
+            if regions is not None and regions[0].strip():
+                return regions
+        except Exception as e:
+            logger.warning("Region OCR error: %s", e)
+        return extract_text_with_confidence(image)
+
 def preprocess_text(text):
     return ' '.join(text.split()).lower()
 
 def validate_college_name(text, threshold=75):
-    text = text.lower().strip()
-    best_score = 0
-    best_match = None
-
-    for college in KNOWN_COLLEGES:
-        score = fuzz.token_set_ratio(college.lower(), text)
-
-        # Optional: Slight bonus if query is a substring of the college name
-        if text in college.lower():
-            score += 10
-
-        print(f"🔍 {college} → Score: {score}")
-        if score > best_score:
-            best_score = score
-            best_match = college
-
-    print(f"✅ Best Match: {best_match} (Score: {best_score})")
-    return (True, best_match) if best_score >= threshold else (False, None)
+    return college_matcher.match(text, threshold)
 
 
-def validate_mandatory_fields(text):
-    roll_match = re.search(r"roll\s*no\.?\s*[:\-]?\s*([\w\d\-]+)", text, re.IGNORECASE)
-    year_match = re.search(r"(first|second|third|fourth)\s+year", text, re.IGNORECASE)
-    course_match = re.search(r"\b(btech|b\.tech|mtech|m\.tech|mba|bsc|msc)\b", text, re.IGNORECASE)
-    branch_match = re.search(r"\b(cse|ece|eee|mech|civil|it|ai\s*ml|ds|cs|ce|eie|aids)\b", text, re.IGNORECASE)
-    return {
-        "roll_number": roll_match.group(1) if roll_match else None,
-        "year": year_match.group(0) if year_match else None,
-        "course": course_match.group(0) if course_match else None,
-        "branch": branch_match.group(0).upper() if branch_match else None
-    }
+def validate_mandatory_fields(text, college=None):
+    fields = extract_fields(text, college)
+    fields.pop("name_extracted", None)
+    return fields
 
 def validate_text(text, expected_user_id):
     results = {
         "user_id_match": expected_user_id.lower() in text
     }
-    # Match name by label or inferred pattern
-    name_match = re.search(
-        r"name\s*[:\-]?\s*([A-Za-z]+(?:\s+[A-Za-z]+){1,4})(?=\s+(roll\s*no|age|dob|gender|address|phone|email|$))",
-        text,
-        re.IGNORECASE
-    )
-    results["name_extracted"] = name_match.group(1).strip() if name_match else None
-    results.update(validate_mandatory_fields(text))
-    results["college_found"], results["matched_college"] = validate_college_name(text)
+    college_found, matched_college = validate_college_name(text)
+    # Name, roll number, year, course and branch, using the college's schema if it has one
+    fields = extract_fields(text, matched_college)
+    results["name_extracted"] = fields.pop("name_extracted", None)
+    results.update(fields)
+    results["college_found"], results["matched_college"] = college_found, matched_college
     return results
 
 def check_face_presence(image):
-    open_cv_image = np.array(image.convert('RGB'))
-    open_cv_image = cv2.cvtColor(open_cv_image, cv2.COLOR_RGB2BGR)
-    gray = cv2.cvtColor(open_cv_image, cv2.COLOR_BGR2GRAY)
-    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
-    return len(faces) > 0
+    if isinstance(image, ImageContext):
+        return face_detector.face_present(image)
+    return len(face_detector.detect_faces(np.array(image.convert('RGB')))) > 0
 
 def run_text_validation(base64_string, user_id, ocr_confidence_threshold=40):
+    try:
+        context = ImageContext.from_base64(base64_string)
+    except Exception as e:
+        logger.warning("Error decoding image: %s", e)
+        context = None
+    return run_text_validation_from_context(context, user_id, ocr_confidence_threshold)
+
+def run_text_validation_from_context(context, user_id, ocr_confidence_threshold=40):
     status = "success"
     message = "Validation completed"
     validation = {}
@@ -133,7 +109,7 @@ def run_text_validation(base64_string, user_id, ocr_confidence_threshold=40):
     is_fake = False
     ocr_confidence = 0.0
     try:
-        image = decode_base64_image(base64_string)
+        image = context.oriented if context is not None else None
         if image is None or image.width == 0 or image.height == 0:
             raise ValueError("Invalid image data or zero dimensions")
     except Exception as e:
@@ -147,7 +123,7 @@ def run_text_validation(base64_string, user_id, ocr_confidence_threshold=40):
             "ocr_confidence": 0.0
         }
 
-    raw_text, avg_confidence = extract_text_with_confidence(image)
+    raw_text, avg_confidence = extract_text_for_context(context)
     extracted_text = raw_text
     cleaned_text = preprocess_text(raw_text)
     ocr_confidence = avg_confidence / 100 if avg_confidence else 0.0
@@ -163,8 +139,9 @@ def run_text_validation(base64_string, user_id, ocr_confidence_threshold=40):
             "ocr_confidence": ocr_confidence
         }
 
-    validation = validate_text(cleaned_text, user_id)
-    validation["face_photo_found"] = check_face_presence(image)
+    with context.timer("college_match"):  # College name and field matching
+        validation = validate_text(cleaned_text, user_id)
+    validation["face_photo_found"] = check_face_presence(context)
     validation["ocr_confidence"] = ocr_confidence
 
     return {
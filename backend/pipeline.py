@@ -0,0 +1,323 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Import your OCR + text validation function
+from ocr_validator import run_text_validation_from_context
+from template_validator import match_template
+
+# Import your image classification function and model loader
+from image_classifier import predict_from_context
+
+from face_detector import face_present
+from image_context import ImageContext
+import metrics
+import model_registry
+import result_cache
+
+logger = logging.getLogger(__name__)
+
+results = result_cache.create_cache()
+
+def cache_version():
+    """The weights this process loaded plus the template set it serves now.
+
+    Not the files on disk: after retraining, this process keeps serving the
+    old weights until it restarts, and its results must not be cached as the
+    new model's.
+    """
+    templates = model_registry.get("template_store").current()
+    return f"{model_registry.version()}-{templates.version}"
+
+def lookup_cached_result(image, user_id):
+    key = result_cache.make_key(image.image_bytes, user_id, cache_version())
+    return key, results.get(key)
+
+def store_result(key, image, user_id, response):
+    # Skip if a model loaded or the template set changed while this request ran
+    if result_cache.make_key(image.image_bytes, user_id, cache_version()) == key:
+        results.set(key, response)
+
+# Bounded pool for the blocking validators (torch and Tesseract release the GIL)
+stage_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("VALIDATION_WORKERS", "4")),
+    thread_name_prefix="validator"
+)
+
+# Per-stage timeouts in seconds; a stage that overruns falls back to its default
+STAGE_TIMEOUTS = {
+    "decode": float(os.environ.get("DECODE_TIMEOUT", "5")),
+    "classifier": float(os.environ.get("CLASSIFIER_TIMEOUT", "10")),
+    "template": float(os.environ.get("TEMPLATE_TIMEOUT", "10")),
+    "ocr": float(os.environ.get("OCR_TIMEOUT", "20")),
+    "face": float(os.environ.get("FACE_TIMEOUT", "5")),
+    "cache": float(os.environ.get("CACHE_TIMEOUT", "2")),
+}
+
+async def run_stage(name, func, *args):
+    # Runs func off the event loop; returns None on error or timeout
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(
+            loop.run_in_executor(stage_executor, func, *args),
+            timeout=STAGE_TIMEOUTS[name]
+        )
+    except asyncio.TimeoutError:
+        metrics.STAGE_FAILURES.inc(stage=name, reason="timeout")
+        logger.warning("%s stage timed out after %ss", name, STAGE_TIMEOUTS[name])
+    except Exception as e:
+        metrics.STAGE_FAILURES.inc(stage=name, reason="error")
+        logger.warning("%s stage error: %s", name, e)
+    return None
+
+# Early-exit cascade: the classifier, template match and face detection run first
+# and OCR, the expensive stage, is skipped once the card is rejected. Face detection
+# waits for the template match so it can search the template's photo box first.
+EARLY_EXIT = os.environ.get("EARLY_EXIT", "1") == "1"
+NON_ID_REJECT_CONFIDENCE = float(os.environ.get("NON_ID_REJECT_CONFIDENCE", "0.9"))
+
+# Add per-stage timings ("timings_ms") to every response, not only when asked for
+RESPONSE_TIMINGS = os.environ.get("RESPONSE_TIMINGS", "0") == "1"
+
+def early_rejection(classifier_result, face_found):
+    """(label, action, reason) if the first-phase stages already decide the outcome, else None."""
+    # face_found is None when the face stage failed; that never short-circuits
+    if face_found is False:
+        return "fake", "rejected", "Face photo not found in ID card"
+    if classifier_result is not None:
+        non_id = classifier_result.get("all_probabilities", {}).get("non-id", 0.0)
+        if non_id >= NON_ID_REJECT_CONFIDENCE:
+            return "fake", "rejected", "Image classifier: not an ID card"
+    return None
+
+def record_metrics(response, image, started, include_timings):
+    """Feed one finished validation into /metrics; returns the response, with timings if asked for."""
+    elapsed = time.perf_counter() - started
+    timings = dict(image.timings) if image is not None else {}
+    metrics.observe_stages(timings)
+    metrics.REQUEST_SECONDS.observe(elapsed, label=response["label"])
+    metrics.REQUESTS.inc(label=response["label"], action=response["action"])
+    for stage in response.get("skipped_stages", []):
+        metrics.SKIPPED_STAGES.inc(stage=stage)
+    if not include_timings:
+        return response
+    timings_ms = {stage: round(seconds * 1000, 2) for stage, seconds in timings.items()}
+    timings_ms["total"] = round(elapsed * 1000, 2)
+    return {**response, "timings_ms": timings_ms}
+
+async def run_validation(user_id, image_base64=None, image_bytes=None, include_timings=RESPONSE_TIMINGS):
+    """Validate one ID image (base64 string or raw bytes) and build the API response."""
+    started = time.perf_counter()
+    image = None
+    # --- Default values to avoid UnboundLocalError ---
+    genuine_confidence = 0.0
+    all_probabilities = {}
+    predicted_class = "unknown"
+    template_score = 0.0
+    ocr_results = {"ocr_confidence": 0.0, "is_fake": True, "validation": {}, "extracted_text": ""}
+    face_photo_found = False  # NEW
+
+    try:
+        # --- Decode once, shared by all validators ---
+        if image_bytes is not None:
+            image = await run_stage("decode", ImageContext, image_bytes)
+        else:
+            image = await run_stage("decode", ImageContext.from_base64, image_base64)
+        if image is not None:
+            # Base64 decode and header parse; the pixel decode is added when the first stage needs it
+            image.timings["decode"] = time.perf_counter() - started
+
+        # --- Repeated submission of the same photo: reuse the earlier result ---
+        cache_key = None
+        if image is not None and results is not None:
+            lookup = await run_stage("cache", lookup_cached_result, image, user_id)
+            if lookup is not None:
+                cache_key, cached = lookup
+                metrics.CACHE_LOOKUPS.inc(result="hit" if cached is not None else "miss")
+                if cached is not None:
+                    return record_metrics(cached, image, started, include_timings)
+
+        early = None
+        skipped_stages = []
+        template_result = ocr_result = face_found = None
+        if EARLY_EXIT:
+            # --- Classifier alongside template match, then face detection in its photo box ---
+            async def template_then_face():
+                matched = await run_stage("template", match_template, image)
+                return matched, await run_stage("face", face_present, image)
+
+            result, (template_result, face_found) = await asyncio.gather(
+                run_stage("classifier", predict_from_context, image),
+                template_then_face(),
+            )
+            early = early_rejection(result, face_found)
+            if early is not None:
+                skipped_stages = ["ocr"]
+            else:
+                ocr_result = await run_stage("ocr", run_text_validation_from_context, image, user_id)
+        else:
+            # --- Classifier, template similarity and OCR run concurrently ---
+            result, template_result, ocr_result = await asyncio.gather(
+                run_stage("classifier", predict_from_context, image),
+                run_stage("template", match_template, image),
+                run_stage("ocr", run_text_validation_from_context, image, user_id),
+            )
+
+        # --- Image-based prediction ---
+        if result is not None:
+            genuine_confidence = float(result.get("genuine_confidence", 0))
+            all_probabilities = result.get("all_probabilities", {})
+            predicted_class = max(all_probabilities, key=all_probabilities.get) if all_probabilities else "unknown"
+
+        # --- Template similarity score ---
+        template_match = None
+        if template_result is not None:
+            template_score = float(template_result.score)
+            template_match = {**template_result._asdict(), "score": round(template_score, 4)}
+
+        # --- OCR Validation ---
+        if ocr_result is not None:
+            ocr_results = ocr_result
+
+        ocr_confidence = float(ocr_results.get("ocr_confidence", 0))
+        is_fake_based_on_ocr = ocr_results.get("is_fake", True)
+        # The face stage's own answer when it ran, so an OCR failure isn't reported as a missing face
+        if face_found is not None:
+            face_photo_found = face_found
+        else:
+            face_photo_found = ocr_results.get("validation", {}).get("face_photo_found", False)
+
+        # --- Combined Validation Score ---
+        weight_image = 0.3
+        weight_ocr = 0.3
+        weight_template = 0.4
+        validation_score = round(
+            weight_image * genuine_confidence +
+            weight_ocr * ocr_confidence +
+            weight_template * template_score,
+            4
+        )
+
+        # --- Decision logic ---
+        threshold = 0.7
+        if early is not None:
+            label, status, reason = early
+        elif not face_photo_found:
+            label = "fake"
+            status = "rejected"
+            reason = "Face photo not found in ID card"
+        elif ocr_confidence == 0.0 or validation_score < 0.6:
+            label = "fake"
+            status = "rejected"
+            reason = "OCR failed completely or validation score is too low"
+        elif validation_score > 0.85:
+            label = "genuine"
+            status = "approved"
+            reason = "High confidence from all validators (image, OCR, template)"
+        elif 0.6 <= validation_score <= 0.85 or ocr_confidence < 0.6:
+            label = "suspicious"
+            status = "manual_review"
+            reason = "Moderate score or low OCR confidence"
+        else:
+            label = "suspicious"
+            status = "manual_review"
+            reason = "Uncertain case, needs manual review"
+
+        response = {
+            "status": "success",
+            "message": "Validation completed",
+            "user_id": user_id,
+            "validation_score": float(validation_score),
+            "threshold": float(threshold),
+            "label": label,
+            "action": status,
+            "reason": reason,
+            "image_classification": {
+                "predicted_class": predicted_class,
+                "genuine_confidence": round(genuine_confidence, 4),
+                "all_probabilities": {
+                    k: round(float(v), 4) for k, v in all_probabilities.items()
+                },
+                "template_similarity_score": round(template_score, 4),
+                "template_match": template_match
+            },
+            "text_validation": ocr_results.get("validation", {}),
+            "extracted_text": ocr_results.get("extracted_text", ""),
+            "ocr_confidence": round(ocr_confidence, 4),
+            "is_fake_based_on_ocr": is_fake_based_on_ocr,
+            "skipped_stages": skipped_stages
+        }
+        # Only complete results are cached; a timed-out or failed stage is retried next time
+        stage_results = [result, template_result] if early is not None else [result, template_result, ocr_result]
+        if cache_key is not None and None not in stage_results:
+            await run_stage("cache", store_result, cache_key, image, user_id, response)
+        return record_metrics(response, image, started, include_timings)
+
+    except Exception as e:
+        logger.exception("Unexpected error: %s", e)
+        return record_metrics({
+            "status": "error",
+            "message": "Unexpected error during processing",
+            "user_id": user_id,
+            "validation_score": 0.0,
+            "threshold": 0.7,
+            "label": "unknown",
+            "action": "manual_review",
+            "reason": "Exception occurred during processing",
+            "image_classification": {
+                "predicted_class": predicted_class,
+                "genuine_confidence": round(genuine_confidence, 4),
+                "all_probabilities": {
+                    k: round(float(v), 4) for k, v in all_probabilities.items()
+                },
+                "template_similarity_score": round(template_score, 4)
+            },
+            "text_validation": {},
+            "extracted_text": "",
+            "ocr_confidence": 0.0,
+            "is_fake_based_on_ocr": True
+        }, image, started, include_timings)
+
+
+# Max items of a batch validated at the same time
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+
+async def validate_many(items, concurrency=BATCH_CONCURRENCY):
+    """Validate (user_id, image_base64, image_bytes) items, yielding (index, result) as each completes.
+
+    Items run concurrently, so their classifier/template forward passes are
+    micro-batched together while OCR runs in parallel on the stage pool.
+    Items are pulled from `items` only as slots free up, so at most
+    `concurrency` of them (and their images) are in memory at once.
+    `image_bytes` may also be a function returning the bytes (e.g. reading a
+    file); it is called when the item starts.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def run_one(index, user_id, image_base64, image_bytes):
+        if callable(image_bytes):
+            try:
+                image_bytes = await loop.run_in_executor(None, image_bytes)
+            except OSError as e:
+                logger.warning("Could not read image for %s: %s", user_id, e)
+                return index, {"status": "error", "message": f"Could not read image: {e}", "user_id": user_id}
+        return index, await run_validation(user_id, image_base64=image_base64, image_bytes=image_bytes)
+
+    pending = set()
+    numbered = enumerate(items)
+    try:
+        while True:
+            for index, item in numbered:
+                pending.add(asyncio.ensure_future(run_one(index, *item)))
+                if len(pending) >= concurrency:
+                    break
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
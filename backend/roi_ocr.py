@@ -0,0 +1,87 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import model_registry
+import ocr_engine
+from template_validator import BASE_DIR, match_template
+
+# Per-template layouts, keyed by the template's layout_id (its index unless the store names one):
+# {"12": {"regions": {"header": [x0, y0, x1, y1], "name": [...], "roll_no": [...], "photo": [...]}}}
+# Boxes are fractions of the card width/height; "photo" is used for face detection, not OCR.
+TEMPLATE_LAYOUTS_PATH = os.path.join(BASE_DIR, "template_layouts.json")
+ROI_MATCH_THRESHOLD = float(os.environ.get("ROI_MATCH_THRESHOLD", "0.85"))
+ROI_PADDING = float(os.environ.get("ROI_PADDING", "0.03"))
+NON_TEXT_REGIONS = {"photo"}
+
+roi_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("ROI_OCR_WORKERS", "4")),
+    thread_name_prefix="roi-ocr"
+)
+
+
+def load_layouts(path=TEMPLATE_LAYOUTS_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+model_registry.register("template_layouts", load_layouts, files=[TEMPLATE_LAYOUTS_PATH])
+
+
+def layout_for(image, compute_match=True):
+    """Layout of the confidently matched template for this request, or None.
+
+    With compute_match=False only an already computed template match is used.
+    """
+    layouts = model_registry.get("template_layouts")
+    if not layouts:
+        return None
+    match = match_template(image) if compute_match else image.peek("template_match")
+    if match is None or match.score < ROI_MATCH_THRESHOLD:
+        return None
+    return layouts.get(match.layout_id)
+
+
+def region_box(box, width, height, padding=ROI_PADDING):
+    x0, y0, x1, y1 = box
+    return (
+        max(0, int((x0 - padding) * width)),
+        max(0, int((y0 - padding) * height)),
+        min(width, int((x1 + padding) * width)),
+        min(height, int((y1 + padding) * height)),
+    )
+
+
+def ocr_words(image):
+    ocr_data = ocr_engine.image_to_data(image)
+    texts = ocr_data['text']
+    confs = ocr_data['conf']
+    words = [txt for txt in texts if txt.strip()]
+    valid_confs = [int(conf) for conf, txt in zip(confs, texts) if txt.strip() and conf != '-1']
+    return words, valid_confs
+
+
+def extract_text_from_regions(image):
+    """(text, average confidence) from the template's text regions, or None to use full-image OCR.
+
+    Regions are cropped from the oriented image and OCR'd in parallel; their
+    text is joined in the layout's region order.
+    """
+    layout = layout_for(image)
+    if not layout:
+        return None
+    oriented = image.oriented
+    boxes = [region_box(box, oriented.width, oriented.height)
+             for name, box in layout.get("regions", {}).items() if name not in NON_TEXT_REGIONS]
+    crops = [oriented.crop(box) for box in boxes if box[2] > box[0] and box[3] > box[1]]
+    if not crops:
+        return None
+
+    words, confs = [], []
+    for region_words, region_confs in roi_executor.map(ocr_words, crops):
+        words.extend(region_words)
+        confs.extend(region_confs)
+    avg_conf = sum(confs) / len(confs) if confs else 0
+    return " ".join(words), avg_conf
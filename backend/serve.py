@@ -0,0 +1,169 @@
+import argparse
+import gc
+import logging
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+
+# Preforking server: the models and template embeddings are loaded once in the
+# parent, then the workers are forked from it and share those pages copy-on-write
+# instead of each holding its own copy. Run from backend/, e.g.
+#   python serve.py --workers 4 --port 8000
+
+logger = logging.getLogger("serve")
+
+# Workers forked again this soon after starting count as crash loops
+RESTART_BACKOFF_S = 1.0
+
+
+def default_threads(workers):
+    # Split the cores between the workers so N workers don't oversubscribe them
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def bind(host, port, backlog=2048):
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def preload():
+    """Import the app and load the shareable assets in the parent."""
+    import torch
+
+    import model_registry
+    from main import app
+
+    if torch.cuda.is_available():
+        # CUDA contexts don't survive fork; each worker loads its own models
+        logger.warning("CUDA available, skipping preload; each worker loads its own models")
+    else:
+        start = time.perf_counter()
+        model_registry.warm_up(fork_safe_only=True)
+        logger.info("Preloaded shared models in %.2fs", time.perf_counter() - start)
+    return app
+
+
+def metrics_dir():
+    """Directory the workers write their metrics to (see metrics.py), emptied of a previous run's files."""
+    path = os.environ.get("METRICS_DIR")
+    if not path:
+        return tempfile.mkdtemp(prefix="id-validator-metrics-"), True
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith((".json", ".json.tmp")):
+            os.remove(os.path.join(path, name))
+    return path, False
+
+
+def run_worker(app, sock, threads, log_level):
+    """Body of a forked worker: per-process thread limits, then a uvicorn server on the shared socket."""
+    import cv2
+    import uvicorn
+
+    import metrics
+    from inference_backends import set_inference_threads
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    gc.enable()
+    set_inference_threads(threads)
+    cv2.setNumThreads(threads)
+    metrics.start_exporter()
+
+    # The app's startup hook loads the per-process assets (batch schedulers, ONNX sessions)
+    server = uvicorn.Server(uvicorn.Config(app, log_level=log_level))
+    server.run(sockets=[sock])
+
+
+def fork_worker(app, sock, threads, log_level):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(app, sock, threads, log_level)
+        except Exception:
+            logger.exception("Worker %d crashed", os.getpid())
+            code = 1
+        finally:
+            os._exit(code)
+    logger.info("Started worker %d (%d inference threads)", pid, threads)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the ID validator with preforked workers sharing the models")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("INFERENCE_THREADS", "0")),
+                        help="Intra-op inference threads per worker (default: cores / workers)")
+    parser.add_argument("--log-level", default=os.environ.get("LOG_LEVEL", "info").lower())
+    args = parser.parse_args()
+    threads = args.threads or default_threads(args.workers)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if not hasattr(os, "fork"):
+        import uvicorn
+        logger.warning("fork() not available on this platform, running a single worker")
+        uvicorn.run("main:app", host=args.host, port=args.port, log_level=args.log_level)
+        return
+
+    os.environ["INFERENCE_THREADS"] = str(threads)
+    # Set before main is imported so /metrics merges every worker's values
+    metrics_path, remove_metrics = metrics_dir()
+    os.environ["METRICS_DIR"] = metrics_path
+    # Keep the collector from touching (and so copying) the preloaded objects' pages
+    gc.disable()
+    app = preload()
+    gc.freeze()
+    sock = bind(args.host, args.port)
+
+    workers = {}
+    for _ in range(args.workers):
+        workers[fork_worker(app, sock, threads, args.log_level)] = time.monotonic()
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Replace workers that die until asked to stop
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = workers.pop(pid, None)
+        if started is None or stopping:
+            continue
+        logger.warning("Worker %d exited with status %d, restarting", pid, status)
+        if time.monotonic() - started < RESTART_BACKOFF_S:
+            time.sleep(RESTART_BACKOFF_S)
+        workers[fork_worker(app, sock, threads, args.log_level)] = time.monotonic()
+
+    sock.close()
+    if remove_metrics:
+        shutil.rmtree(metrics_path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
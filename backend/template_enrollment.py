@@ -0,0 +1,150 @@
+import argparse
+import os
+import threading
+
+import numpy as np
+import torch
+from PIL import Image
+
+import model_registry
+import template_validator
+from combined_model import USE_COMBINED_MODEL
+from image_context import tensor_transform
+from image_files import image_files
+from inference_backends import INFERENCE_BACKEND
+from template_store import (TEMPLATE_STORE_DIR, TemplateSet, current_version, load_version, publish,
+                            store_lock, weights_fingerprint)
+
+# Incremental template enrollment: embed only the new template images with the
+# current (frozen) model and publish a new store version next to the existing
+# templates. Serving processes hot-reload it; nothing is retrained.
+ENROLL_BATCH_SIZE = 16
+
+_float_model = None
+_float_model_lock = threading.Lock()
+
+
+def embedding_model():
+    """The float32 model the published embeddings came from (the resident one when serving)."""
+    global _float_model
+    if USE_COMBINED_MODEL:
+        combined = model_registry.get("combined_model")
+        return lambda batch: combined(batch)[1]
+    if INFERENCE_BACKEND == "torch":
+        return model_registry.get("template_model")
+    # INT8 / ONNX outputs differ slightly from the float32 embeddings in the store
+    with _float_model_lock:
+        if _float_model is None:
+            _float_model = template_validator.load_model(backend="torch")
+    return _float_model
+
+
+def embed_images(images, model, batch_size=ENROLL_BATCH_SIZE):
+    """(N, D) float32 embeddings for PIL images, preprocessed as in template_train.py."""
+    embeddings = []
+    with torch.no_grad():
+        for i in range(0, len(images), batch_size):
+            batch = torch.stack([tensor_transform(image.convert('RGB')) for image in images[i:i + batch_size]])
+            embeddings.append(model(batch.to(template_validator.DEVICE)).cpu().numpy())
+    return np.concatenate(embeddings).astype(np.float32)
+
+
+def current_templates(root=TEMPLATE_STORE_DIR):
+    """The live template set on disk (the legacy template_embeddings.npy if nothing is published)."""
+    version = current_version(root)
+    if version is None:
+        return TemplateSet(template_validator.load_template_index(), None, "legacy")
+    return load_version(version, root)
+
+
+def _model_fingerprint(base):
+    if USE_COMBINED_MODEL or not os.path.exists(template_validator.MODEL_SAVE_PATH):
+        return base.model
+    fingerprint = weights_fingerprint(template_validator.MODEL_SAVE_PATH)
+    if base.model and base.model != fingerprint:
+        raise ValueError("The template model changed since the live set was built; re-run template_train.py")
+    return fingerprint
+
+
+def update_templates(images=(), templates=(), files=(), college=None, root=TEMPLATE_STORE_DIR):
+    """Publish the live set minus the removed templates plus `images` (one metadata dict each).
+
+    Templates whose file is in `files` or whose college is `college` are removed.
+    Returns a summary with the new version.
+    """
+    remove_files = set(files)
+    with store_lock(root):
+        base = current_templates(root)
+        model = _model_fingerprint(base)
+        keep = [i for i, t in enumerate(base.templates)
+                if t["file"] not in remove_files and not (college and t["college"] == college)]
+
+        # Pin every kept template's layout_id so layouts keyed by its old index survive removals
+        kept = [{**base.templates[i], "layout_id": base.layout_id(i)} for i in keep]
+        embeddings = [np.asarray(base.index.embeddings)[keep]]
+        if images:
+            embeddings.append(embed_images(list(images), embedding_model()))
+        new_templates = kept + list(templates)
+        if not new_templates:
+            raise ValueError("Refusing to publish an empty template set")
+
+        version = publish(np.concatenate(embeddings), new_templates, root,
+                          build_ann=template_validator.TEMPLATE_INDEX_BACKEND == "ann", model=model)
+    return {"version": version, "added": len(images), "removed": len(base) - len(keep),
+            "templates": len(new_templates)}
+
+
+def enroll(images, names, college=None, layout_id=None, root=TEMPLATE_STORE_DIR):
+    """Add template images (re-enrolling replaces templates with the same file name).
+
+    New templates use `layout_id`, or their file name, as the key into
+    template_layouts.json.
+    """
+    templates = [{"file": name, "college": college, "layout_id": layout_id or name} for name in names]
+    return update_templates(images, templates, files=names, root=root)
+
+
+def remove(files=(), college=None, root=TEMPLATE_STORE_DIR):
+    """Remove templates by file name and/or college."""
+    return update_templates(files=files, college=college, root=root)
+
+
+def main():
+    # Run from backend/, e.g.
+    #   python template_enrollment.py add new_college/ --college "XYZ Institute of Technology"
+    #   python template_enrollment.py remove --college "Old College"
+    #   python template_enrollment.py list
+    parser = argparse.ArgumentParser(description="Add or remove templates without retraining")
+    parser.add_argument("--root", default=TEMPLATE_STORE_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    add_p = sub.add_parser("add")
+    add_p.add_argument("paths", nargs="+", help="Template images or directories of them")
+    add_p.add_argument("--college")
+    add_p.add_argument("--layout-id", help="Key into template_layouts.json (default: file name)")
+    remove_p = sub.add_parser("remove")
+    remove_p.add_argument("--file", nargs="+", default=[], help="Template file names")
+    remove_p.add_argument("--college")
+    sub.add_parser("list")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        base = current_templates(args.root)
+        print(f"Template version {base.version}: {len(base)} templates")
+        for i, t in enumerate(base.templates):
+            print(f"{i:5d}  {t['file'] or '-'}  {t['college'] or '-'}  layout={base.layout_id(i)}")
+        return
+
+    if args.command == "add":
+        paths = [f for path in args.paths for f in (image_files(path) if os.path.isdir(path) else [path])]
+        images = [Image.open(path) for path in paths]
+        summary = enroll(images, [os.path.basename(p) for p in paths], args.college, args.layout_id, args.root)
+    else:
+        if not args.file and not args.college:
+            parser.error("remove needs --file and/or --college")
+        summary = remove(args.file, args.college, args.root)
+    print(f"✅ Published template version {summary['version']}: +{summary['added']} "
+          f"-{summary['removed']} ({summary['templates']} templates)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import numpy as np
+
+
+def _as_matrix(queries):
+    queries = np.asarray(queries, dtype=np.float32)
+    if queries.ndim == 1:
+        queries = queries[None, :]
+    return queries
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class TemplateIndex:
+    """Exact cosine-similarity index over the template embeddings.
+
+    Embeddings are L2-normalized once into a contiguous float32 matrix so a
+    whole batch of queries is scored with a single matrix product.
+    """
+
+    def __init__(self, embeddings, normalized=None):
+        # Both may be read-only memory maps (template_store); contiguous float32 inputs aren't copied
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or len(embeddings) == 0:
+            raise ValueError("Template embeddings must be a non-empty (N, D) array")
+        self.embeddings = embeddings
+        if normalized is None:
+            normalized = _normalize(embeddings)
+        self.normalized = np.ascontiguousarray(normalized, dtype=np.float32)
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(np.load(path))
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    @property
+    def dim(self):
+        return self.embeddings.shape[1]
+
+    def similarities(self, queries):
+        """Cosine similarity of every query against every template, shape (Q, N)."""
+        return _normalize(_as_matrix(queries)) @ self.normalized.T
+
+    def search(self, queries, k=1):
+        """Return (scores, indices) of the top-k templates for each query, best first."""
+        sims = self.similarities(queries)
+        k = min(k, sims.shape[1])
+        if k == sims.shape[1]:
+            top = np.argsort(-sims, axis=1)
+        else:
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            order = np.argsort(-np.take_along_axis(sims, top, axis=1), axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+        return np.take_along_axis(sims, top, axis=1)[:, :k], top[:, :k]
+
+    def find_duplicates(self, queries, atol=1e-6, rtol=1e-5):
+        """Index of a template each query is numerically identical to, or -1.
+
+        Candidates are taken from the similarity matrix (near-identical vectors
+        have cosine ~1) and then confirmed with the same tolerance as np.allclose.
+        """
+        queries = _as_matrix(queries)
+        sims = _normalize(queries) @ self.normalized.T
+        result = np.full(len(queries), -1, dtype=np.int64)
+        for q, row in enumerate(sims):
+            for idx in np.flatnonzero(row >= 1.0 - 1e-4):
+                if np.allclose(queries[q], self.embeddings[idx], atol=atol, rtol=rtol):
+                    result[q] = idx
+                    break
+        return result
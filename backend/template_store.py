@@ -0,0 +1,264 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+from template_index import TemplateIndex, _normalize
+
+logger = logging.getLogger(__name__)
+
+# Versioned template store. Each version is an immutable directory:
+#   <version>/embeddings.npy   raw template embeddings, (N, D) float32
+#   <version>/normalized.npy   L2-normalized copy, memory-mapped for search
+#   <version>/metadata.json    {"version", "created", "model", "templates": [{"file", "college", "layout_id"}, ...]}
+#   <version>/ann.npz          optional IVF index (TEMPLATE_INDEX_BACKEND=ann)
+# and CURRENT names the live one. Publishing writes a new version next to the
+# old ones and swaps CURRENT atomically, so readers never see a partial set.
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+TEMPLATE_STORE_DIR = os.environ.get("TEMPLATE_STORE_DIR", os.path.join(BASE_DIR, "template_store"))
+# How often a serving process re-checks CURRENT for a newly published version
+TEMPLATE_STORE_POLL_S = float(os.environ.get("TEMPLATE_STORE_POLL_S", "2"))
+# Versions kept on disk (including the live one) for rollback
+TEMPLATE_STORE_KEEP = int(os.environ.get("TEMPLATE_STORE_KEEP", "3"))
+CURRENT_FILE = "CURRENT"
+
+
+def weights_fingerprint(path):
+    """Content hash of a weights file; embeddings are only comparable under the same weights."""
+    digest = hashlib.blake2b(digest_size=8)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def template_metadata(count, templates=None):
+    """Per-template metadata, filling in the keys missing from `templates`."""
+    templates = templates if templates is not None else [{} for _ in range(count)]
+    if len(templates) != count:
+        raise ValueError(f"{len(templates)} metadata entries for {count} embeddings")
+    return [{"file": t.get("file"), "college": t.get("college"), "layout_id": t.get("layout_id")}
+            for t in templates]
+
+
+class TemplateSet:
+    """One version of the templates: the search index plus per-template metadata."""
+
+    def __init__(self, index, templates, version, model=None):
+        self.index = index
+        self.templates = template_metadata(len(index), templates)
+        self.version = version
+        self.model = model  # weights_fingerprint of the model that produced the embeddings
+
+    def __len__(self):
+        return len(self.templates)
+
+    def layout_id(self, idx):
+        # Layouts are keyed by template index unless the template names its own
+        return self.templates[idx]["layout_id"] or str(idx)
+
+
+def current_version(root=TEMPLATE_STORE_DIR):
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def list_versions(root=TEMPLATE_STORE_DIR):
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root)
+                  if not name.startswith(".") and os.path.isdir(os.path.join(root, name)))
+
+
+def load_version(version, root=TEMPLATE_STORE_DIR, index_backend="exact", nprobe=8):
+    path = os.path.join(root, version)
+    with open(os.path.join(path, "metadata.json"), encoding="utf-8") as f:
+        metadata = json.load(f)
+    ann_path = os.path.join(path, "ann.npz")
+    if index_backend == "ann" and os.path.exists(ann_path):
+        from ann_index import IVFTemplateIndex
+        index = IVFTemplateIndex.load(ann_path, nprobe=nprobe)
+    else:
+        # Memory-mapped: pages are shared by every worker through the page cache
+        index = TemplateIndex(np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r"),
+                              normalized=np.load(os.path.join(path, "normalized.npy"), mmap_mode="r"))
+    return TemplateSet(index, metadata["templates"], metadata["version"], metadata.get("model"))
+
+
+@contextmanager
+def store_lock(root=TEMPLATE_STORE_DIR):
+    """Exclusive lock for read-modify-publish updates (template enrollment) across processes."""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, ".lock"), "w") as f:
+        try:
+            import fcntl
+        except ImportError:  # Windows: single-process enrollment only
+            yield
+            return
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def activate(version, root=TEMPLATE_STORE_DIR):
+    """Make `version` the live template set (atomic rename of CURRENT)."""
+    if not os.path.isdir(os.path.join(root, version)):
+        raise FileNotFoundError(f"No template version '{version}' in {root}")
+    tmp_path = os.path.join(root, f".{CURRENT_FILE}.{uuid.uuid4().hex}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+
+def prune(root=TEMPLATE_STORE_DIR, keep=TEMPLATE_STORE_KEEP):
+    """Delete the oldest versions beyond `keep`, never the live one."""
+    live = current_version(root)
+    old = [v for v in list_versions(root) if v != live]
+    for version in old[:max(0, len(old) - (keep - 1))]:
+        # Processes still mapping these files keep reading them until they reload
+        shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+
+
+def publish(embeddings, templates=None, root=TEMPLATE_STORE_DIR, build_ann=False, keep=TEMPLATE_STORE_KEEP,
+            model=None):
+    """Write a new template version and make it live. Returns the version name."""
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if embeddings.ndim != 2 or len(embeddings) == 0:
+        raise ValueError("Template embeddings must be a non-empty (N, D) array")
+    templates = template_metadata(len(embeddings), templates)
+
+    os.makedirs(root, exist_ok=True)
+    version = time.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:6]
+    tmp_path = os.path.join(root, f".{version}.tmp")
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, "embeddings.npy"), embeddings)
+    np.save(os.path.join(tmp_path, "normalized.npy"), _normalize(embeddings).astype(np.float32))
+    with open(os.path.join(tmp_path, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": version, "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                   "count": len(embeddings), "dim": embeddings.shape[1], "model": model,
+                   "templates": templates}, f, indent=2)
+    if build_ann:
+        from ann_index import IVFTemplateIndex
+        IVFTemplateIndex.build(embeddings).save(os.path.join(tmp_path, "ann.npz"))
+
+    os.rename(tmp_path, os.path.join(root, version))
+    activate(version, root)
+    prune(root, keep)
+    return version
+
+
+class TemplateStore:
+    """The live TemplateSet, picking up newly published versions without a restart.
+
+    CURRENT is re-checked at most every `poll_interval` seconds when the set
+    is requested, rather than from a watcher thread, so the store can be loaded
+    before serve.py forks its workers. Without a published store, `fallback`
+    builds the set from the legacy template_embeddings.npy.
+
+    With `model` set (the serving weights' fingerprint), versions embedded by
+    other weights (a retrained backbone) are not hot-swapped in; they take
+    effect once the process restarts with the new weights.
+    """
+
+    def __init__(self, root=TEMPLATE_STORE_DIR, index_backend="exact", nprobe=8,
+                 poll_interval=TEMPLATE_STORE_POLL_S, fallback=None, model=None):
+        self.root = root
+        self.index_backend = index_backend
+        self.nprobe = nprobe
+        self.poll_interval = poll_interval
+        self.fallback = fallback
+        self.model = model
+        self._lock = threading.Lock()
+        self._version = current_version(root)
+        self._current = self._load(self._version)
+        self._checked = time.monotonic()
+
+    def _load(self, version):
+        if version is None:
+            if self.fallback is None:
+                raise FileNotFoundError(f"No published template set in {self.root}")
+            return self.fallback()
+        return load_version(version, self.root, self.index_backend, self.nprobe)
+
+    def current(self):
+        if time.monotonic() - self._checked >= self.poll_interval:
+            self.reload()
+        return self._current
+
+    def reload(self):
+        """Switch to the version named by CURRENT if it changed; keeps serving the old one on failure."""
+        if not self._lock.acquire(blocking=False):
+            return  # Another request is already checking
+        try:
+            self._checked = time.monotonic()
+            version = current_version(self.root)
+            if version == self._version or version is None:
+                return
+            try:
+                templates = self._load(version)
+            except Exception as e:
+                logger.warning("Could not load template version %s, keeping %s: %s", version, self._version, e)
+                return
+            if self.model and templates.model and templates.model != self.model:
+                logger.warning("Template version %s was embedded with different weights, keeping %s "
+                               "until restart", version, self._version)
+                self._version = version  # Don't reload it on every poll
+                return
+            self._current, self._version = templates, version
+            logger.info("Switched to template version %s (%d templates)", version, len(templates))
+        finally:
+            self._lock.release()
+
+
+def main():
+    # Run from backend/, e.g.
+    #   python template_store.py list
+    #   python template_store.py activate 20250601T120000-1a2b3c   (roll back)
+    #   python template_store.py publish ../template_embeddings.npy --metadata templates.json
+    parser = argparse.ArgumentParser(description="Manage the versioned template store")
+    parser.add_argument("--root", default=TEMPLATE_STORE_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list")
+    activate_p = sub.add_parser("activate")
+    activate_p.add_argument("version")
+    publish_p = sub.add_parser("publish")
+    publish_p.add_argument("embeddings", help=".npy file with the (N, D) embeddings")
+    publish_p.add_argument("--metadata", help="JSON list with one {file, college, layout_id} entry per embedding")
+    publish_p.add_argument("--ann", action="store_true", help="Also build the IVF index")
+    publish_p.add_argument("--model", help="Weights file the embeddings were extracted with")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        live = current_version(args.root)
+        for version in list_versions(args.root):
+            print(("* " if version == live else "  ") + version)
+    elif args.command == "activate":
+        activate(args.version, args.root)
+        print(f"✅ {args.version} is live")
+    else:
+        templates = None
+        if args.metadata:
+            with open(args.metadata, encoding="utf-8") as f:
+                templates = json.load(f)
+        model = weights_fingerprint(args.model) if args.model else None
+        version = publish(np.load(args.embeddings), templates, args.root, build_ann=args.ann, model=model)
+        print(f"✅ Published template version {version}")
+
+
+if __name__ == "__main__":
+    main()
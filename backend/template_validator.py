@@ -1,29 +1,40 @@
-import base64
-from io import BytesIO
-from PIL import Image
-from torchvision import transforms
 import torch
 import torch.nn as nn
 import numpy as np
 from torchvision.models import resnet50, ResNet50_Weights
+import logging
 import os
+from collections import namedtuple
+
+import model_registry
+from batching import batched
+from inference_backends import INFERENCE_BACKEND, load_exported, weight_files
+from combined_model import USE_COMBINED_MODEL, combined_forward
+from template_index import TemplateIndex
+from template_store import TEMPLATE_STORE_DIR, TemplateSet, TemplateStore, weights_fingerprint
+from image_context import ImageContext, tensor_transform
 
 # Configs
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 MODEL_SAVE_PATH = os.path.join(BASE_DIR, "resnet_template.pth")
 EMBEDDINGS_SAVE_PATH = os.path.join(BASE_DIR, "template_embeddings.npy")
-BEST_EMB_SAVE_PATH = os.path.join(BASE_DIR, "best_matched_embedding.npy")
+ANN_INDEX_SAVE_PATH = os.path.join(BASE_DIR, "template_ann_index.npz")
+# "exact" scans every template; "ann" uses the IVF index built by ann_index.py
+TEMPLATE_INDEX_BACKEND = os.environ.get("TEMPLATE_INDEX_BACKEND", "exact")
+ANN_NPROBE = int(os.environ.get("TEMPLATE_ANN_NPROBE", "8"))
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+logger = logging.getLogger(__name__)
+
 # Image Transform
-data_transforms = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406],
-                         [0.229, 0.224, 0.225])
-])
-
-def load_model():
+data_transforms = tensor_transform
+
+def load_model(backend=INFERENCE_BACKEND):
+    # INT8 / ONNX Runtime export if selected and available (see export_models.py)
+    exported = load_exported(MODEL_SAVE_PATH, backend)
+    if exported is not None:
+        return exported
+
     # ✅ Load pre-trained weights properly
     model = resnet50(weights=ResNet50_Weights.DEFAULT)
     model.fc = nn.Identity()  # Remove final classification layer
@@ -36,17 +47,45 @@ def load_model():
     model.eval()
     return model
 
+def load_template_index():
+    if TEMPLATE_INDEX_BACKEND == "ann" and os.path.exists(ANN_INDEX_SAVE_PATH):
+        from ann_index import IVFTemplateIndex
+        return IVFTemplateIndex.load(ANN_INDEX_SAVE_PATH, nprobe=ANN_NPROBE)
+    return TemplateIndex.from_file(EMBEDDINGS_SAVE_PATH)
+
+def load_template_store():
+    # Versioned store published by template_train.py; the legacy .npy until one exists
+    model = None
+    if not USE_COMBINED_MODEL and os.path.exists(MODEL_SAVE_PATH):
+        model = weights_fingerprint(MODEL_SAVE_PATH)
+    return TemplateStore(TEMPLATE_STORE_DIR, index_backend=TEMPLATE_INDEX_BACKEND, nprobe=ANN_NPROBE,
+                         fallback=lambda: TemplateSet(load_template_index(), None, "legacy"), model=model)
+
+if not USE_COMBINED_MODEL:
+    model_registry.register("template_model", load_model, fork_safe=INFERENCE_BACKEND != "onnx",
+                            files=weight_files(MODEL_SAVE_PATH))
+    model_registry.register("template_runner",
+                            lambda: batched(model_registry.get("template_model"), DEVICE, name="template-batcher"),
+                            fork_safe=False)
+# The published versions hot-reload; the version served is part of the result cache key (pipeline.py)
+model_registry.register("template_store", load_template_store, files=[EMBEDDINGS_SAVE_PATH, ANN_INDEX_SAVE_PATH])
+
+# Best template for a request; college/layout_id come from the template's metadata
+TemplateMatch = namedtuple("TemplateMatch", ["index", "score", "college", "layout_id", "version"])
+
 def extract_embedding(model, image_tensor):
     with torch.no_grad():
         emb = model(image_tensor)  # Output: (1, 2048)
     return emb.cpu().numpy()
 
-def is_test_image_in_templates(test_emb, template_embeddings, threshold=1e-6):
-    for idx, emb in enumerate(template_embeddings):
-        if np.allclose(test_emb, emb, atol=threshold):
-            print(f"⚠️ Test image matches template at index {idx}")
-            return True
-    print("✅ Test image is NOT part of the templates.")
+def is_test_image_in_templates(test_emb, template_index, threshold=1e-6):
+    if isinstance(template_index, np.ndarray):
+        template_index = TemplateIndex(template_index)
+    idx = int(template_index.find_duplicates(test_emb, atol=threshold)[0])
+    if idx >= 0:
+        logger.debug("Test image matches template at index %d", idx)
+        return True
+    logger.debug("Test image is NOT part of the templates.")
     return False
 
 def cosine_similarity(a, b):
@@ -55,32 +94,45 @@ def cosine_similarity(a, b):
     return np.dot(a_norm, b_norm)
 
 def validation_score_from_base64(base64_str):
-    # Decode and process image
-    image_data = base64.b64decode(base64_str)
-    img = Image.open(BytesIO(image_data)).convert('RGB')
-    img_tensor = data_transforms(img).unsqueeze(0).to(DEVICE)
-
-    # Load model and embeddings
-    model = load_model()
-    embeddings = np.load(EMBEDDINGS_SAVE_PATH)
-
-    test_emb = extract_embedding(model, img_tensor)[0]  # Shape: (2048,)
-
-    # Check for duplicate embedding
-    print(is_test_image_in_templates(test_emb, embeddings))
-
-    # Compare with templates
-    sims = [cosine_similarity(test_emb, emb) for emb in embeddings]
-    best_idx = int(np.argmax(sims))
-    best_score = sims[best_idx]
-    best_emb = embeddings[best_idx]
-
-    # Save best match
-    np.save(BEST_EMB_SAVE_PATH, best_emb)
-
-    # Print debug info
-    print("\n🧪 Test Image Embedding:\n", test_emb)
-    print("\n🏆 Best Matched Template Embedding (Index={}):\n".format(best_idx), best_emb)
-    print(f"\n✅ Cosine Similarity Score: {best_score:.6f}")
-
-    return best_score
+    return validation_score_from_context(ImageContext.from_base64(base64_str))
+
+def validation_score_from_context(image: ImageContext):
+    return match_template(image).score
+
+def match_template(image: ImageContext):
+    """Best TemplateMatch, computed once per request and shared with ROI OCR and face detection."""
+    return image.memo("template_match", lambda: _match_template(image))
+
+def _match_template(image: ImageContext):
+    # Shared model and memory-mapped embeddings; a newly published template set is picked up here
+    templates = model_registry.get("template_store").current()
+    index = templates.index
+
+    if USE_COMBINED_MODEL:
+        _, emb = combined_forward(image)  # Shared with the image classifier
+        test_emb = emb.numpy()[0]
+    else:
+        img_tensor = image.tensor.to(DEVICE)
+        model = model_registry.get("template_runner")  # Micro-batched across requests
+        with image.timer("template_embedding"):
+            test_emb = extract_embedding(model, img_tensor)[0]  # Shape: (2048,)
+
+    # Compare with templates (single matrix product over all templates)
+    with image.timer("template_match"):
+        scores, indices = index.search(test_emb, k=1)
+    best_idx = int(indices[0, 0])
+    best_score = float(scores[0, 0])
+    if best_idx < 0:
+        # No candidate (empty index): no match rather than template -1 with a -inf score
+        return TemplateMatch(-1, 0.0, None, None, templates.version)
+
+    # Debug info; the duplicate scan and array formatting only run when DEBUG is enabled
+    if logger.isEnabledFor(logging.DEBUG):
+        is_test_image_in_templates(test_emb, index)
+        logger.debug("Test image embedding: %s", test_emb)
+        logger.debug("Best matched template embedding (index=%d): %s", best_idx, index.embeddings[best_idx])
+        logger.debug("Cosine similarity score: %.6f", best_score)
+
+    template = templates.templates[best_idx]
+    return TemplateMatch(best_idx, best_score, template["college"], templates.layout_id(best_idx),
+                         templates.version)
@@ -2,83 +2,104 @@ import os
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torchvision import datasets, models, transforms
-from torch.utils.data import DataLoader, random_split
+from torchvision import datasets, models
+from torch.utils.data import Subset
 
-# Set device
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-print(f"Using device: {device}")
+from training import DEVICE, TRAIN_SEED, cached_dataset, clear_checkpoint, fit, make_loader, seed_everything
 
-# Transformations (same as during prediction)
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406],
-                         [0.229, 0.224, 0.225])
-])
+# COMBINED_MODEL=1 trains the shared-backbone model (see combined_model.py)
+USE_COMBINED_MODEL = os.environ.get("COMBINED_MODEL", "0") == "1"
 
 # Dataset path (go one level up to find 'dataset/')
 data_dir = os.path.join(os.path.dirname(__file__), '..', 'dataset')
-if not os.path.exists(data_dir):
-    raise FileNotFoundError(f"Dataset folder '{data_dir}' not found!")
-
-# Load dataset
-full_dataset = datasets.ImageFolder(root=data_dir, transform=transform)
-class_names = full_dataset.classes
-print(f"Classes found: {class_names}")
-
-# Split into train and validation
-train_size = int(0.85 * len(full_dataset))
-val_size = len(full_dataset) - train_size
-train_dataset, val_dataset = random_split(full_dataset, [train_size, val_size])
-
-# Dataloaders
-train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True)
-val_loader = DataLoader(val_dataset, batch_size=32, shuffle=False)
-
-# Load pre-trained ResNet18
-model = models.resnet18(pretrained=True)
-model.fc = nn.Linear(model.fc.in_features, len(class_names))  # dynamic number of classes
-model = model.to(device)
-
-# Loss and optimizer
-criterion = nn.CrossEntropyLoss()
-optimizer = optim.Adam(model.parameters(), lr=0.001)
-
-# Training loop
-def train_model(epochs=10):
-    for epoch in range(epochs):
-        model.train()
-        total_loss = 0
+CHECKPOINT_PATH = os.path.join(os.path.dirname(__file__), 'train_checkpoint.pt')
+BATCH_SIZE = 32
+NUM_EPOCHS = 10
+
+# Set device
+device = DEVICE
+
+
+def load_datasets():
+    """Train/validation split of dataset/ (class per folder), read from the preprocessed cache."""
+    if not os.path.exists(data_dir):
+        raise FileNotFoundError(f"Dataset folder '{data_dir}' not found!")
+    folder = datasets.ImageFolder(root=data_dir)
+    files = [path for path, _ in folder.samples]
+    labels = [label for _, label in folder.samples]
+    full_dataset = cached_dataset(files, "dataset", labels)
 
-        for imgs, labels in train_loader:
+    # Fixed split, so a resumed run validates on the same images
+    train_size = int(0.85 * len(full_dataset))
+    order = torch.randperm(len(full_dataset), generator=torch.Generator().manual_seed(TRAIN_SEED)).tolist()
+    return folder.classes, Subset(full_dataset, order[:train_size]), Subset(full_dataset, order[train_size:])
+
+
+def build_model(num_classes):
+    """(model, trainable parameters, forward returning logits)."""
+    if USE_COMBINED_MODEL:
+        # 3-class head on the frozen template ResNet-50 (run template_train.py first)
+        from combined_model import CombinedIDModel
+        model = CombinedIDModel.from_template_backbone(num_classes=num_classes).to(device)
+        return model, model.head.parameters(), lambda imgs: model(imgs)[0]  # also returns embeddings
+
+    # Load pre-trained ResNet18
+    model = models.resnet18(pretrained=True)
+    model.fc = nn.Linear(model.fc.in_features, num_classes)  # dynamic number of classes
+    model = model.to(device)
+    return model, model.parameters(), model
+
+
+def evaluate(forward, model, val_loader):
+    model.eval()
+    correct = 0
+    total = 0
+    with torch.no_grad():
+        for imgs, labels in val_loader:
             imgs, labels = imgs.to(device), labels.to(device)
-            optimizer.zero_grad()
-            outputs = model(imgs)
-            loss = criterion(outputs, labels)
-            loss.backward()
-            optimizer.step()
-            total_loss += loss.item()
-
-        print(f"Epoch {epoch+1}/{epochs} - Training Loss: {total_loss:.4f}")
-
-        # Validation
-        model.eval()
-        correct = 0
-        total = 0
-        with torch.no_grad():
-            for imgs, labels in val_loader:
-                imgs, labels = imgs.to(device), labels.to(device)
-                outputs = model(imgs)
-                _, preds = torch.max(outputs, 1)
-                correct += (preds == labels).sum().item()
-                total += labels.size(0)
-
-        acc = 100 * correct / total
-        print(f"Validation Accuracy: {acc:.2f}%\n")
-
-# Train and save the model
-train_model(epochs=10)
-save_path = os.path.join(os.path.dirname(__file__), 'id_resnet_model.pth')
-torch.save(model.state_dict(), save_path)
-print("Model trained and saved with softmax support for scoring.")
+            _, preds = torch.max(forward(imgs), 1)
+            correct += (preds == labels).sum().item()
+            total += labels.size(0)
+    return 100 * correct / total if total else 0.0
+
+
+def main(epochs=NUM_EPOCHS):
+    print(f"Using device: {device}")
+    seed_everything()
+    class_names, train_dataset, val_dataset = load_datasets()
+    print(f"Classes found: {class_names}")
+
+    # Dataloaders
+    train_loader = make_loader(train_dataset, BATCH_SIZE, shuffle=True)
+    val_loader = make_loader(val_dataset, BATCH_SIZE, shuffle=False)
+
+    model, trainable_params, forward = build_model(len(class_names))
+
+    # Loss and optimizer
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(trainable_params, lr=0.001)
+
+    def train_mode():
+        model.train()
+        if USE_COMBINED_MODEL:
+            model.backbone.eval()  # Keep frozen BatchNorm statistics
+
+    def validate(epoch, loss):
+        print(f"Validation Accuracy: {evaluate(forward, model, val_loader):.2f}%\n")
+
+    fit(model, optimizer, train_loader, lambda imgs, labels: criterion(forward(imgs), labels), epochs,
+        checkpoint_path=CHECKPOINT_PATH, train_mode=train_mode, on_epoch_end=validate)
+
+    # Save the model
+    if USE_COMBINED_MODEL:
+        from combined_model import COMBINED_MODEL_PATH
+        save_path = COMBINED_MODEL_PATH
+    else:
+        save_path = os.path.join(os.path.dirname(__file__), 'id_resnet_model.pth')
+    torch.save(model.state_dict(), save_path)
+    clear_checkpoint(CHECKPOINT_PATH)
+    print("Model trained and saved with softmax support for scoring.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import random
+from contextlib import nullcontext
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+
+# Shared training utilities for train.py and template_train.py: a one-time
+# preprocessed image cache, multi-process loading, mixed precision,
+# checkpoint/resume and deterministic embedding extraction.
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+TRAIN_CACHE_DIR = os.environ.get("TRAIN_CACHE_DIR", os.path.join(BASE_DIR, ".train_cache"))
+TRAIN_NUM_WORKERS = int(os.environ.get("TRAIN_NUM_WORKERS", str(min(8, os.cpu_count() or 1))))
+# "auto": bfloat16 autocast on CPUs with native bf16 (AVX512-BF16/AMX), float16 on CUDA; "0" disables
+TRAIN_AMP = os.environ.get("TRAIN_AMP", "auto")
+TRAIN_RESUME = os.environ.get("TRAIN_RESUME", "1") == "1"
+TRAIN_SEED = int(os.environ.get("TRAIN_SEED", "0"))
+IMAGE_SIZE = 224
+MEAN = torch.tensor([0.485, 0.456, 0.406]).view(3, 1, 1)
+STD = torch.tensor([0.229, 0.224, 0.225]).view(3, 1, 1)
+DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def seed_everything(seed=TRAIN_SEED):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+# --- Preprocessed image cache ---
+
+class _DecodeDataset(Dataset):
+    # Decode + resize only; used once to fill the cache
+    def __init__(self, files, size):
+        self.files = files
+        self.size = size
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getitem__(self, idx):
+        image = Image.open(self.files[idx]).convert('RGB').resize((self.size, self.size), Image.BILINEAR)
+        return idx, torch.from_numpy(np.asarray(image, dtype=np.uint8).copy())
+
+
+def _cache_key(files, size):
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(str(size).encode())
+    for path in files:
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def build_image_cache(files, name, size=IMAGE_SIZE, cache_dir=TRAIN_CACHE_DIR, num_workers=TRAIN_NUM_WORKERS):
+    """Path of a (N, size, size, 3) uint8 .npy holding `files` decoded and resized.
+
+    Built once (in parallel) and reused until any of the files changes, so
+    epochs read small memory-mapped arrays instead of re-decoding JPEGs.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{name}-{_cache_key(files, size)}.npy")
+    if os.path.exists(path):
+        return path
+
+    tmp_path = path + ".tmp.npy"
+    cache = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8, shape=(len(files), size, size, 3))
+    loader = DataLoader(_DecodeDataset(files, size), batch_size=32, num_workers=num_workers)
+    for indices, images in loader:
+        cache[indices.numpy()] = images.numpy()
+    cache.flush()
+    del cache
+    os.replace(tmp_path, path)
+    print(f"Cached {len(files)} preprocessed images in {path}")
+    return path
+
+
+class CachedImageDataset(Dataset):
+    """Normalized tensors from the uint8 cache, with optional labels.
+
+    Matches Resize((224, 224)) -> ToTensor() -> Normalize(ImageNet mean/std).
+    The memory map is opened lazily so each DataLoader worker maps it itself.
+    """
+
+    def __init__(self, cache_path, files, labels=None):
+        self.cache_path = cache_path
+        self.files = list(files)
+        self.labels = labels
+        self._images = None
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getitem__(self, idx):
+        if self._images is None:
+            self._images = np.load(self.cache_path, mmap_mode="r")
+        image = torch.from_numpy(np.array(self._images[idx])).permute(2, 0, 1).float().div_(255)
+        image = (image - MEAN) / STD
+        label = self.labels[idx] if self.labels is not None else 0
+        return image, label
+
+
+def cached_dataset(files, name, labels=None, size=IMAGE_SIZE):
+    return CachedImageDataset(build_image_cache(files, name, size), files, labels)
+
+
+def make_loader(dataset, batch_size, shuffle, num_workers=TRAIN_NUM_WORKERS, seed=TRAIN_SEED):
+    generator = torch.Generator()
+    generator.manual_seed(seed)
+    return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, num_workers=num_workers,
+                      persistent_workers=num_workers > 0, pin_memory=DEVICE.type == "cuda",
+                      generator=generator)
+
+
+# --- Mixed precision ---
+
+def _cpu_has_bf16():
+    checks = [getattr(torch.cpu, name, None) for name in ("_is_avx512_bf16_supported", "_is_amx_tile_supported")]
+    return any(check() for check in checks if check is not None)
+
+
+def amp_dtype(device=DEVICE, mode=TRAIN_AMP):
+    """Autocast dtype for `device`, or None for full float32."""
+    if mode == "0":
+        return None
+    if device.type == "cuda":
+        return torch.float16
+    if mode == "1" or _cpu_has_bf16():
+        return torch.bfloat16
+    return None
+
+
+def autocast(device=DEVICE, dtype=None):
+    if dtype is None:
+        return nullcontext()
+    return torch.autocast(device_type=device.type, dtype=dtype)
+
+
+# --- Checkpoints ---
+
+def save_checkpoint(path, model, optimizer, epoch, scaler=None):
+    state = {
+        "epoch": epoch,
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "scaler": scaler.state_dict() if scaler is not None else None,
+        "torch_rng": torch.get_rng_state(),
+    }
+    tmp_path = path + ".tmp"
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path, model, optimizer, scaler=None):
+    """Restore a checkpoint; returns the epoch to continue from."""
+    state = torch.load(path, map_location="cpu", weights_only=False)
+    model.load_state_dict(state["model"])
+    optimizer.load_state_dict(state["optimizer"])
+    if scaler is not None and state.get("scaler") is not None:
+        scaler.load_state_dict(state["scaler"])
+    torch.set_rng_state(state["torch_rng"])
+    return state["epoch"] + 1
+
+
+def clear_checkpoint(path):
+    """Remove a finished run's checkpoint so the next run starts fresh."""
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def fit(model, optimizer, loader, loss_fn, epochs, checkpoint_path=None, resume=TRAIN_RESUME,
+        device=DEVICE, train_mode=None, on_epoch_end=None):
+    """Train for `epochs`, checkpointing after each one and resuming from `checkpoint_path`.
+
+    `loss_fn(inputs, targets)` runs the forward pass and returns the loss;
+    `train_mode()` replaces model.train() (e.g. to keep a frozen backbone in
+    eval mode); `on_epoch_end(epoch, loss)` runs after each epoch (validation).
+    """
+    dtype = amp_dtype(device)
+    scaler = torch.cuda.amp.GradScaler() if dtype == torch.float16 else None
+    start = 0
+    if checkpoint_path and resume and os.path.exists(checkpoint_path):
+        start = load_checkpoint(checkpoint_path, model, optimizer, scaler)
+        print(f"Resuming from {checkpoint_path} at epoch {start + 1}/{epochs}")
+    if dtype is not None:
+        print(f"Mixed precision: {dtype}")
+
+    for epoch in range(start, epochs):
+        if train_mode is not None:
+            train_mode()
+        else:
+            model.train()
+        total_loss = 0.0
+        for inputs, targets in loader:
+            inputs = inputs.to(device, non_blocking=True)
+            targets = targets.to(device, non_blocking=True)
+            optimizer.zero_grad(set_to_none=True)
+            with autocast(device, dtype):
+                loss = loss_fn(inputs, targets)
+            if scaler is not None:
+                scaler.scale(loss).backward()
+                scaler.step(optimizer)
+                scaler.update()
+            else:
+                loss.backward()
+                optimizer.step()
+            total_loss += loss.item() * inputs.size(0)
+
+        epoch_loss = total_loss / len(loader.dataset)
+        print(f"Epoch {epoch+1}/{epochs} - Loss: {epoch_loss:.4f}")
+        if on_epoch_end is not None:
+            on_epoch_end(epoch, epoch_loss)
+        if checkpoint_path:
+            save_checkpoint(checkpoint_path, model, optimizer, epoch, scaler)
+
+
+# --- Embedding extraction ---
+
+def extract_embeddings(embed, dataset, batch_size=64, device=DEVICE):
+    """(embeddings, files) in the dataset's file order; `embed(batch)` returns (B, D) features."""
+    loader = make_loader(dataset, batch_size, shuffle=False)
+    embeddings = []
+    with torch.no_grad():
+        for inputs, _ in loader:
+            embeddings.append(embed(inputs.to(device)).float().cpu().numpy())
+    return np.concatenate(embeddings).astype(np.float32), list(dataset.files)
+
+
+def save_file_list(files, embeddings_path):
+    """Record which file each embedding row came from, next to the .npy."""
+    path = os.path.splitext(embeddings_path)[0] + "_files.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([os.path.basename(p) for p in files], f, indent=2)
+    return path
@@ -0,0 +1,55 @@
+import os
+
+# Raw upload limits for /validate-id/upload
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class InvalidUpload(Exception):
+    pass
+
+
+def check_declared_size(content_length, limit=MAX_UPLOAD_BYTES):
+    """Validate the Content-Length header before reading any of the body.
+
+    Returns the declared size (None if the header is absent).
+    """
+    if content_length is None:
+        return None
+    try:
+        size = int(content_length)
+    except ValueError:
+        raise InvalidUpload(f"Invalid Content-Length: {content_length!r}")
+    if size < 0:
+        raise InvalidUpload(f"Invalid Content-Length: {content_length!r}")
+    if size > limit:
+        raise UploadTooLarge(f"Upload of {size} bytes exceeds the {limit} byte limit")
+    return size
+
+
+async def read_capped(chunks, limit=MAX_UPLOAD_BYTES):
+    """Read an async stream of byte chunks, enforcing `limit`.
+
+    The buffer grows with the bytes actually received, so small uploads stay
+    small and oversized ones are rejected as soon as they cross the limit.
+    Returns the bytearray itself rather than a bytes copy of it.
+    """
+    buffer = bytearray()
+    async for chunk in chunks:
+        if len(buffer) + len(chunk) > limit:
+            raise UploadTooLarge(f"Upload exceeds the {limit} byte limit")
+        buffer += chunk
+    return buffer
+
+
+async def iter_upload_file(upload, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Async chunk iterator over a Starlette UploadFile."""
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from functools import partial
+
+import model_registry
+from image_files import image_files
+from pipeline import BATCH_CONCURRENCY, validate_many
+
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def load_items(path):
+    """Yield ((user_id, image_base64, image_bytes), label) for each image.
+
+    `path` is either a directory of images (user id = file name without
+    extension) or a JSONL manifest with `user_id` and either `image_path`
+    (relative to the manifest) or `image_base64` on each line. Image files
+    are not read here: `image_bytes` is a reader that validate_many calls
+    when the item runs.
+    """
+    if os.path.isdir(path):
+        for image_path in image_files(path):
+            user_id = os.path.splitext(os.path.basename(image_path))[0]
+            yield (user_id, None, partial(read_file, image_path)), image_path
+        return
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "image_base64" in entry:
+                yield (entry["user_id"], entry["image_base64"], None), f"{path}:{line_no}"
+            else:
+                image_path = os.path.join(base_dir, entry["image_path"])
+                yield (entry["user_id"], None, partial(read_file, image_path)), image_path
+
+
+async def run(entries, out, concurrency):
+    """Validate `entries` from load_items, writing one NDJSON line per item; returns the item count."""
+    labels = []
+
+    def items():
+        for item, label in entries:
+            labels.append(label)
+            yield item
+
+    async for index, result in validate_many(items(), concurrency=concurrency):
+        out.write(json.dumps({"index": index, "source": labels[index], **result}) + "\n")
+        out.flush()
+    return len(labels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate many ID card images, writing NDJSON results")
+    parser.add_argument("path", help="Directory of images or JSONL manifest")
+    parser.add_argument("--out", help="Output NDJSON file (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    args = parser.parse_args()
+
+    model_registry.warm_up()
+
+    out = open(args.out, "w") if args.out else sys.stdout
+    try:
+        count = asyncio.run(run(load_items(args.path), out, args.concurrency))
+    finally:
+        if args.out:
+            out.close()
+    print(f"✅ Validated {count} images", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()